@@ -29,9 +29,38 @@ DEFAULT_CONFIG = {
     # voucher_expiry_type = "fixed_period" or "end_of_year"
     "voucher_expiry_type": "end_of_year",
     "yearly_worker_voucher_limit": 120,
+    # Number of rows written per INSERT/UPDATE statement by bulk voucher operations
+    "voucher_bulk_batch_size": 1000,
+    # Seconds a voucher_check result is kept in the cache, 0 disables caching
+    "voucher_check_cache_ttl": 60,
+    # Seconds the economic units of a user are shared between requests, 0 resolves them once per request
+    "user_policyholders_cache_ttl": 0,
     "validate_created_worker_online": False,
     "csv_worker_upload_errors_column": "errors",
-    "worker_upload_chf_id_type": "national_id"
+    "worker_upload_chf_id_type": "national_id",
+    # Number of national ids looked up, and of workers inserted, per statement by the worker upload. Workers without
+    # a photo are inserted with bulk_create, insuree_service.create_or_update is still sent for each of them, but the
+    # economic unit memberships skip PolicyHolderInsureeService.create, which has no service signal to send
+    "worker_upload_batch_size": 1000,
+    # Number of uploaded rows read, imported and committed together with the upload checkpoint
+    "worker_upload_commit_batch_size": 1000,
+    # Start processing queued worker uploads in a thread of the web process right after they are submitted.
+    # When disabled, worker_voucher.tasks.process_worker_uploads must be added to SCHEDULER_JOBS, or the
+    # processworkeruploads command run periodically, otherwise uploads stay TRIGGERED
+    "worker_upload_background_thread": True,
+    # Seconds without progress after which an IN_PROGRESS upload is considered abandoned (e.g. its process was
+    # restarted) and is claimed again, must exceed the time needed to import one commit batch
+    "worker_upload_stale_timeout": 1800,
+    # Parallel MConnect lookups of an upload, seconds after which a lookup is reported as failed
+    # and maximum lookups started per second (0 for no limit)
+    "mconnect_concurrency": 8,
+    "mconnect_timeout": 10,
+    "mconnect_rate_limit": 0,
+    # Seconds MConnect worker data is cached by economic unit and national id for the preview, create and upload
+    # of the same worker, 0 disables the cache. Entries go to the Django cache of the given alias, point it to a
+    # cache with its own MAX_ENTRIES (or maxmemory) to bound the number of workers kept
+    "mconnect_cache_ttl": 300,
+    "mconnect_cache_alias": "default"
 }
 
 
@@ -60,9 +89,21 @@ class WorkerVoucherConfig(AppConfig, ConfigUtilMixin):
     voucher_expiry_period = None
     voucher_expiry_type = None
     yearly_worker_voucher_limit = None
+    voucher_bulk_batch_size = None
+    voucher_check_cache_ttl = None
+    user_policyholders_cache_ttl = None
     validate_created_worker_online = None
     csv_worker_upload_errors_column = None
     worker_upload_chf_id_type = None
+    worker_upload_batch_size = None
+    worker_upload_commit_batch_size = None
+    worker_upload_background_thread = None
+    worker_upload_stale_timeout = None
+    mconnect_concurrency = None
+    mconnect_timeout = None
+    mconnect_rate_limit = None
+    mconnect_cache_ttl = None
+    mconnect_cache_alias = None
 
     def ready(self):
         from core.models import ModuleConfiguration
@@ -76,3 +117,13 @@ class WorkerVoucherConfig(AppConfig, ConfigUtilMixin):
             return f"csv_worker_upload/economic_unit_{economic_unit_code}/{file_name}"
         return f"csv_worker_upload/economic_unit_{economic_unit_code}"
 
+    @staticmethod
+    def get_worker_upload_file_path(economic_unit_code, upload_id, file_name):
+        # Each upload has its own folder, files of the same name uploaded to an economic unit do not collide
+        return f"{WorkerVoucherConfig.get_worker_upload_payment_file_path(economic_unit_code)}/{upload_id}/{file_name}"
+
+    @staticmethod
+    def get_worker_upload_report_file_path(economic_unit_code, upload_id, file_name):
+        report_name = f"{file_name.rsplit('.', 1)[0]}_errors.csv"
+        return WorkerVoucherConfig.get_worker_upload_file_path(economic_unit_code, upload_id, report_name)
+
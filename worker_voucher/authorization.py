@@ -0,0 +1,98 @@
+from typing import FrozenSet, Iterable, Union
+
+from django.core.cache import cache
+
+from core.models import InteractiveUser, User
+from policyholder.models import PolicyHolderUser
+from worker_voucher.apps import WorkerVoucherConfig
+
+
+class UserAuthorizationContext:
+    """
+    Permission checks and the set of economic units a user is linked to, resolved once per request.
+    The context is stored on the user object, which lives as long as the request, and is dropped as soon as
+    any PolicyHolderUser changes. The economic unit ids can additionally be shared between requests through
+    the django cache, see WorkerVoucherConfig.user_policyholders_cache_ttl.
+    """
+    USER_ATTRIBUTE = '_worker_voucher_authorization_context'
+    CACHE_KEY_PREFIX = 'worker_voucher_user_policyholders_'
+
+    # Bumped on every PolicyHolderUser change, contexts built for an older version are rebuilt
+    _version = 0
+
+    def __init__(self, user: User):
+        self.user = user
+        self.version = UserAuthorizationContext._version
+        self._is_imis_admin = None
+        self._perms = {}
+        self._policyholder_ids = None
+
+    @classmethod
+    def for_user(cls, user: Union[User, InteractiveUser]) -> 'UserAuthorizationContext':
+        user = _get_core_user(user)
+        context = user.__dict__.get(cls.USER_ATTRIBUTE)
+        if context is None or context.version != cls._version:
+            context = cls(user)
+            setattr(user, cls.USER_ATTRIBUTE, context)
+        return context
+
+    @classmethod
+    def invalidate(cls, user_id=None):
+        cls._version += 1
+        if user_id:
+            cache.delete(cls._get_cache_key(user_id))
+
+    @property
+    def is_imis_admin(self) -> bool:
+        if self._is_imis_admin is None:
+            self._is_imis_admin = bool(self.user.is_imis_admin)
+        return self._is_imis_admin
+
+    def has_perms(self, perms: Iterable[str]) -> bool:
+        key = tuple(perms)
+        if key not in self._perms:
+            self._perms[key] = self.user.has_perms(key)
+        return self._perms[key]
+
+    def can_access_all_economic_units(self, perms: Iterable[str]) -> bool:
+        return self.is_imis_admin or self.has_perms(perms)
+
+    @property
+    def policyholder_ids(self) -> FrozenSet:
+        if self._policyholder_ids is None:
+            self._policyholder_ids = self._load_policyholder_ids()
+        return self._policyholder_ids
+
+    def _load_policyholder_ids(self) -> FrozenSet:
+        ttl = WorkerVoucherConfig.user_policyholders_cache_ttl
+        cache_key = self._get_cache_key(self.user.id)
+        if ttl:
+            policyholder_ids = cache.get(cache_key)
+            if policyholder_ids is not None:
+                return policyholder_ids
+
+        policyholder_ids = frozenset(PolicyHolderUser.objects.filter(
+            user=self.user,
+            is_deleted=False,
+            user__validity_to__isnull=True,
+            user__i_user__validity_to__isnull=True,
+            policy_holder__is_deleted=False,
+        ).values_list('policy_holder_id', flat=True))
+
+        if ttl:
+            cache.set(cache_key, policyholder_ids, ttl)
+        return policyholder_ids
+
+    @classmethod
+    def _get_cache_key(cls, user_id) -> str:
+        return f'{cls.CACHE_KEY_PREFIX}{user_id}'
+
+
+def get_user_authorization_context(user: Union[User, InteractiveUser]) -> UserAuthorizationContext:
+    return UserAuthorizationContext.for_user(user)
+
+
+def _get_core_user(user: Union[User, InteractiveUser]) -> User:
+    if isinstance(user, InteractiveUser):
+        return user.user
+    return user
@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from invoice.models import BillItem
+from worker_voucher.services import get_workers_yearly_voucher_counts
+
+
+def get_request_dataloader(context, name, loader_factory):
+    """
+    Returns the loader stored on the request context, creating it with loader_factory on first use.
+    Loaders may be bound to the request user, so they must not outlive the request.
+    """
+    if not hasattr(context, "dataloaders"):
+        context.dataloaders = {}
+    if name not in context.dataloaders:
+        context.dataloaders[name] = loader_factory()
+    return context.dataloaders[name]
+
+
+class WorkerYearlyVoucherCountLoader(DataLoader):
+    """
+    Loads {policyholder_code: count} of active vouchers for (insuree_id, year) keys with one grouped query.
+    """
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    def batch_load_fn(self, keys):
+        counts = get_workers_yearly_voucher_counts({insuree_id for insuree_id, _ in keys}, self.user,
+                                                   {year for _, year in keys})
+        counts_by_key = defaultdict(dict)
+        for (insuree_id, policyholder_code, year), count in counts.items():
+            counts_by_key[(insuree_id, year)][policyholder_code] = count
+        return Promise.resolve([counts_by_key.get(key, {}) for key in keys])
+
+
+class VoucherBillIdLoader(DataLoader):
+    """
+    Loads the id of the bill covering each voucher id key with one query.
+    """
+
+    def batch_load_fn(self, keys):
+        bill_ids = {}
+        for line_id, bill_id in BillItem.objects.filter(
+                line_id__in=[str(key) for key in keys],
+                is_deleted=False,
+                bill__is_deleted=False,
+        ).values_list('line_id', 'bill_id'):
+            bill_ids.setdefault(line_id, bill_id)
+        return Promise.resolve([bill_ids.get(str(key)) for key in keys])
@@ -11,14 +11,14 @@ from core.schema import OpenIMISMutation
 from insuree.apps import InsureeConfig
 from insuree.gql_mutations import CreateInsureeMutation, CreateInsureeInputType
 from insuree.models import Insuree
-from msystems.services.mconnect_worker_service import MConnectWorkerService
 from policyholder.models import PolicyHolder, PolicyHolderInsuree
 from policyholder.services import PolicyHolderInsuree as PolicyHolderInsureeService
 from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.mconnect import fetch_worker_online_data
 from worker_voucher.models import WorkerVoucher, WorkerGroup
 from worker_voucher.services import WorkerVoucherService, GroupOfWorkerService, validate_acquire_unassigned_vouchers, \
-    validate_acquire_assigned_vouchers, validate_assign_vouchers, create_assigned_voucher, create_voucher_bill, \
-    create_unassigned_voucher, assign_voucher, economic_unit_user_filter, check_existing_active_vouchers
+    validate_acquire_assigned_vouchers, validate_assign_vouchers, create_assigned_vouchers, create_voucher_bill, \
+    create_unassigned_vouchers, assign_vouchers, economic_unit_user_filter, check_existing_active_vouchers
 
 
 class CreateWorkerMutation(CreateInsureeMutation):
@@ -50,7 +50,7 @@ class CreateWorkerMutation(CreateInsureeMutation):
                 }
             ]
         if WorkerVoucherConfig.validate_created_worker_online:
-            online_result = MConnectWorkerService().fetch_worker_data(chf_id, user, ph)
+            online_result = fetch_worker_online_data(chf_id, user, ph)
             if not online_result.get("success", False):
                 return online_result
             else:
@@ -277,12 +277,10 @@ class AcquireUnassignedVouchersMutation(BaseMutation):
             return validate_result
 
         policyholder_id = validate_result.get("data").get("policyholder").id
-        voucher_ids = []
         with transaction.atomic():
-            for _ in range(validate_result.get("data").get("count")):
-                voucher_ids.append(create_unassigned_voucher(user, policyholder_id))
+            voucher_codes = create_unassigned_vouchers(user, policyholder_id, validate_result.get("data").get("count"))
 
-            bill = create_voucher_bill(user, voucher_ids, policyholder_id)
+            bill = create_voucher_bill(user, list(voucher_codes), policyholder_id, voucher_codes=voucher_codes)
 
             mutation = MutationLog.objects.get(
                 client_mutation_id=client_mutation_id,
@@ -329,15 +327,14 @@ class AcquireAssignedVouchersMutation(BaseMutation):
             return validate_result
 
         policyholder_id = validate_result.get("data").get("policyholder").id
-        voucher_ids = []
+        insuree_ids = [insuree.id for insuree in validate_result.get("data").get("insurees")]
         with transaction.atomic():
-            for date in validate_result.get("data").get("dates"):
-                for insuree in validate_result.get("data").get("insurees"):
-                    voucher_ids.append(create_assigned_voucher(user, date, insuree.id, policyholder_id))
-            if not voucher_ids:
+            voucher_codes = create_assigned_vouchers(user, validate_result.get("data").get("dates"), insuree_ids,
+                                                     policyholder_id)
+            if not voucher_codes:
                 raise ValidationError("worker_voucher.validation.no_vouchers_created")
 
-            bill = create_voucher_bill(user, voucher_ids, policyholder_id)
+            bill = create_voucher_bill(user, list(voucher_codes), policyholder_id, voucher_codes=voucher_codes)
             mutation = MutationLog.objects.get(
                 client_mutation_id=client_mutation_id,
                 client_mutation_label=client_mutation_label)
@@ -379,13 +376,10 @@ class AssignVouchersMutation(BaseMutation):
         if not validate_result.get("success", False):
             return validate_result
 
-        voucher_ids = []
-        vouchers = validate_result.get("data").get("unassigned_vouchers")
+        insuree_ids = [insuree.id for insuree in validate_result.get("data").get("insurees")]
         with transaction.atomic():
-            for date in validate_result.get("data").get("dates"):
-                for insuree in validate_result.get("data").get("insurees"):
-                    voucher = vouchers.pop(0)
-                    voucher_ids.append(assign_voucher(user, insuree.id, voucher.id, date))
+            assign_vouchers(user, insuree_ids, validate_result.get("data").get("dates"),
+                            validate_result.get("data").get("unassigned_vouchers"))
         return None
 
     class Input(AssignVouchersMutationInput):
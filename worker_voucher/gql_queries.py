@@ -4,17 +4,18 @@ from graphene_django import DjangoObjectType
 from core import ExtendedConnection, prefix_filterset, datetime
 from insuree.gql_queries import InsureeGQLType, PhotoGQLType, GenderGQLType
 from insuree.models import Insuree
-from invoice.models import Bill
 from policyholder.gql import PolicyHolderGQLType
+from worker_voucher.dataloaders import get_request_dataloader, WorkerYearlyVoucherCountLoader, VoucherBillIdLoader
 from worker_voucher.models import WorkerVoucher, GroupOfWorker, WorkerGroup
-from worker_voucher.services import get_worker_yearly_voucher_count_counts
 
 
 class WorkerGQLType(InsureeGQLType):
     vouchers_this_year = graphene.JSONString()
 
     def resolve_vouchers_this_year(self, info):
-        return get_worker_yearly_voucher_count_counts(self.id, info.context.user, datetime.date.today().year)
+        loader = get_request_dataloader(info.context, "worker_yearly_voucher_count_loader",
+                                        lambda: WorkerYearlyVoucherCountLoader(info.context.user))
+        return loader.load((self.id, datetime.date.today().year))
 
     class Meta:
         model = Insuree
@@ -72,11 +73,8 @@ class WorkerVoucherGQLType(DjangoObjectType):
         return self.date_updated.to_ad_date()
 
     def resolve_bill_id(self, info, **kwargs):
-        bill = Bill.objects.filter(line_items_bill__line_id=self.id,
-                                   line_items_bill__is_deleted=False,
-                                   is_deleted=False).first()
-        if bill:
-            return bill.id
+        loader = get_request_dataloader(info.context, "worker_voucher_bill_id_loader", VoucherBillIdLoader)
+        return loader.load(self.id)
 
 
 class AcquireVouchersValidationSummaryGQLType(graphene.ObjectType):
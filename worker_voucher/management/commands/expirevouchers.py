@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from worker_voucher.tasks import expire_vouchers
+
+
+class Command(BaseCommand):
+    help = "This command moves UNASSIGNED vouchers, and ASSIGNED vouchers assigned in a past year, " \
+           "past their expiry date to EXPIRED."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", type=str, default=None,
+                            help="User recorded as the author of the change, the administrator by default")
+
+    def handle(self, *args, **options):
+        expired = expire_vouchers(options["username"])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} voucher(s)"))
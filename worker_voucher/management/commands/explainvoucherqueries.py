@@ -0,0 +1,136 @@
+import re
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import datetime
+from invoice.models import Bill
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import get_voucher_worker_enquire_filters
+
+
+class Command(BaseCommand):
+    help = "This command prints the scans the database plans for the worker voucher hot-path queries. With " \
+           "--compare it prints them without the worker_voucher indexes as well, with --check it fails when a " \
+           "query still scans the voucher or bill table sequentially. Plans depend on the volumes and statistics " \
+           "of the database, run it against production-like volumes, e.g. from generatevoucherdata."
+
+    SCAN_PATTERN = re.compile(r"(?:Parallel )?(Seq Scan|Index Only Scan|Bitmap Index Scan|Bitmap Heap Scan|Index Scan)"
+                              r"(?: using (\w+))?(?: on \"?(\w+)\"?)?")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            dest='analyze',
+            help='Execute each query once and print the timings of that run (EXPLAIN ANALYZE, PostgreSQL only)',
+        )
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            dest='compare',
+            help='Also print the plans without the worker_voucher indexes, dropped in a rolled back transaction '
+                 '(PostgreSQL only)',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            dest='check',
+            help='Fail when a query still scans the voucher or bill table sequentially',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            dest='verbose',
+            help='Print the full plans instead of the scan summary',
+        )
+
+    def handle(self, *args, **options):
+        sample = WorkerVoucher.objects.filter(is_deleted=False, insuree__isnull=False, policyholder__isnull=False) \
+            .values('insuree_id', 'policyholder_id', 'insuree__chf_id', 'code').first()
+        if not sample:
+            raise CommandError("No assigned vouchers found, generate some data first, e.g. with generatevoucherdata")
+
+        today = datetime.datetime.now()
+        year = today.year
+        active_statuses = (WorkerVoucher.Status.ASSIGNED, WorkerVoucher.Status.AWAITING_PAYMENT)
+
+        queries = {
+            "check_existing_active_vouchers": WorkerVoucher.objects.filter(
+                insuree_id__in=[sample['insuree_id']],
+                policyholder_id=sample['policyholder_id'],
+                status__in=active_statuses,
+                is_deleted=False,
+                assigned_date__gte=today,
+                assigned_date__lt=today + datetime.datetimedelta(days=30),
+            ).values('id')[:1],
+            "_check_unassigned_vouchers": WorkerVoucher.objects.filter(
+                insuree=None,
+                assigned_date=None,
+                expiry_date__gte=today,
+                policyholder_id=sample['policyholder_id'],
+                status=WorkerVoucher.Status.UNASSIGNED,
+                is_deleted=False,
+            ).order_by('expiry_date').values('id')[:100],
+            "get_workers_yearly_voucher_counts": WorkerVoucher.objects.filter(
+                is_deleted=False,
+                status__in=active_statuses,
+                insuree_id__in=[sample['insuree_id']],
+                assigned_date__gte=datetime.date(year, 1, 1),
+                assigned_date__lt=datetime.date(year + 1, 1, 1),
+            ).values('insuree_id', 'policyholder_id').order_by(),
+            "get_voucher_worker_enquire_filters": WorkerVoucher.objects.filter(
+                *get_voucher_worker_enquire_filters(sample['insuree__chf_id'])).values('id'),
+            "worker_voucher_bill_user_filter": Bill.objects.filter(
+                subject_id__in=[str(sample['policyholder_id']), str(sample['policyholder_id']).upper()],
+            ).values('id'),
+        }
+
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        plans = self._explain(queries, explain_options)
+        plans_without_indexes = self._explain_without_indexes(queries, explain_options) \
+            if options['compare'] else {}
+        for name, plan in plans.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if name in plans_without_indexes:
+                self.stdout.write("  without the worker_voucher indexes:")
+                self._write_plan(plans_without_indexes[name], options['verbose'])
+                self.stdout.write("  with the worker_voucher indexes:")
+            self._write_plan(plan, options['verbose'])
+
+        if options['check']:
+            tables = {WorkerVoucher._meta.db_table, Bill._meta.db_table}
+            sequential = [name for name, plan in plans.items() if any(
+                scan_type == 'Seq Scan' and table_name in tables
+                for scan_type, _index_name, table_name in self.SCAN_PATTERN.findall(plan))]
+            if sequential:
+                raise CommandError(f"Sequential scans of the voucher or bill table in: {', '.join(sequential)}")
+
+    def _explain(self, queries, explain_options):
+        return {name: queryset.explain(**explain_options) for name, queryset in queries.items()}
+
+    def _explain_without_indexes(self, queries, explain_options):
+        """
+        Plans of the queries with the indexes of the worker_voucher migrations dropped. The indexes are dropped in
+        a transaction that is always rolled back, which takes an exclusive lock on the tables until it ends.
+        """
+        if connection.vendor != 'postgresql':
+            raise CommandError("--compare needs PostgreSQL, its DDL statements can be rolled back")
+        bill_index = import_module('worker_voucher.migrations.0019_bill_subject_id_index').BILL_SUBJECT_INDEX
+        with transaction.atomic():
+            with connection.schema_editor(atomic=False) as schema_editor:
+                for index in WorkerVoucher._meta.indexes:
+                    schema_editor.remove_index(WorkerVoucher, index)
+                schema_editor.remove_index(Bill, bill_index)
+            plans = self._explain(queries, explain_options)
+            transaction.set_rollback(True)
+        return plans
+
+    def _write_plan(self, plan, verbose):
+        if verbose:
+            self.stdout.write(plan)
+            return
+        for scan_type, index_name, table_name in self.SCAN_PATTERN.findall(plan):
+            style = self.style.WARNING if scan_type == 'Seq Scan' else self.style.SUCCESS
+            self.stdout.write(style(f"  {scan_type} on {table_name or '-'} using {index_name or '-'}"))
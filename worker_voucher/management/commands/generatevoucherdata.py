@@ -0,0 +1,242 @@
+import random
+import uuid
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import datetime
+from core.models import InteractiveUser, User, UserRole, Role
+from insuree.models import Insuree
+from policyholder.models import PolicyHolder, PolicyHolderUser, PolicyHolderInsuree
+from worker_voucher.models import WorkerVoucher, GroupOfWorker, WorkerGroup
+from worker_voucher.tasks import get_batch_user
+from worker_voucher.utils import bulk_create_with_ids, get_idnp_crc
+
+
+class Command(BaseCommand):
+    help = "This command bulk generates economic units, their users, workers, groups of workers and vouchers " \
+           "for load testing. The same seed and prefix always produce the same data. Rows are inserted with " \
+           "bulk_create in a single transaction, mostly without history rows, do not run it against a production " \
+           "database."
+
+    # Share of the assigned vouchers in each status
+    VOUCHER_STATUS_WEIGHTS = {
+        WorkerVoucher.Status.ASSIGNED: 75,
+        WorkerVoucher.Status.AWAITING_PAYMENT: 5,
+        WorkerVoucher.Status.EXPIRED: 10,
+        WorkerVoucher.Status.CANCELED: 5,
+        WorkerVoucher.Status.CLOSED: 5,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policyholders', type=int, default=100, help='Number of economic units')
+        parser.add_argument('--users-per-policyholder', type=int, default=1,
+                            help='Number of users linked to each economic unit')
+        parser.add_argument('--workers-per-policyholder', type=int, default=50,
+                            help='Number of workers of each economic unit')
+        parser.add_argument('--groups-per-policyholder', type=int, default=2,
+                            help='Number of groups of workers of each economic unit')
+        parser.add_argument('--vouchers-per-worker', type=int, default=20,
+                            help='Number of assigned vouchers of each worker per year')
+        parser.add_argument('--unassigned-per-policyholder', type=int, default=10,
+                            help='Number of unassigned vouchers of each economic unit')
+        parser.add_argument('--years', type=int, default=2,
+                            help='Number of years, up to the current one, the assigned vouchers are spread over')
+        parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows per INSERT')
+        parser.add_argument('--prefix', type=str, default='LOAD',
+                            help='Prefix of the generated economic unit codes and user names')
+        parser.add_argument('--username', type=str, default=None,
+                            help='User recorded as the author of the data, the administrator by default')
+
+    def handle(self, *args, **options):
+        if options['vouchers_per_worker'] > 365:
+            raise CommandError("A worker can have at most one voucher per day, use at most 365 vouchers per worker")
+        prefix = options['prefix']
+        if PolicyHolder.objects.filter(code__startswith=prefix).exists() \
+                or User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"Data with the prefix {prefix} already exists, use another --prefix")
+
+        # Ids and national ids depend on the prefix as well, runs with another prefix do not collide
+        self.rng = random.Random(f"{options['seed']}:{prefix}")
+        self.batch_size = options['batch_size']
+        self.user = get_batch_user(options['username'])
+        self.now = datetime.datetime.now()
+
+        worker_count = options['policyholders'] * options['workers_per_policyholder']
+        first_idnp = self.rng.randint(200000000000, 299999999999 - worker_count)
+        if Insuree.objects.filter(chf_id__gte=str(first_idnp), chf_id__lt=str(first_idnp + worker_count)).exists():
+            raise CommandError("National ids of the generated workers are already used, use another --seed or --prefix")
+
+        with transaction.atomic():
+            policyholder_ids = self._generate_policyholders(prefix, options['policyholders'])
+            self._generate_policyholder_users(prefix, policyholder_ids, options['users_per_policyholder'])
+            workers = self._generate_workers(policyholder_ids, options['workers_per_policyholder'], first_idnp)
+            self._generate_groups(workers, options['groups_per_policyholder'])
+            self._generate_vouchers(workers, options['vouchers_per_worker'], options['years'],
+                                    options['unassigned_per_policyholder'])
+
+    def _generate_policyholders(self, prefix, count):
+        policyholders = [PolicyHolder(
+            id=self._uuid(),
+            code=f"{prefix}{index:08d}",
+            trade_name=f"Load test economic unit {index}",
+            **self._history_fields(),
+        ) for index in range(count)]
+        self._insert(PolicyHolder, policyholders)
+        return [policyholder.id for policyholder in policyholders]
+
+    def _generate_policyholder_users(self, prefix, policyholder_ids, users_per_policyholder):
+        login_names = {f"{prefix}_user_{index:08d}_{user_index}": policyholder_id
+                       for index, policyholder_id in enumerate(policyholder_ids)
+                       for user_index in range(users_per_policyholder)}
+        role = Role.objects.filter(name='Employer', validity_to__isnull=True).first()
+        for batch in _batches(login_names, self.batch_size):
+            i_users = bulk_create_with_ids(InteractiveUser, [InteractiveUser(
+                language_id='en',
+                last_name="Load test",
+                other_names=login_name,
+                login_name=login_name,
+            ) for login_name in batch], 'login_name', user=self.user)
+            i_user_ids = {i_user.login_name: i_user.id for i_user in i_users}
+            if role:
+                UserRole.objects.bulk_create([UserRole(
+                    user_id=i_user_id, role=role, audit_user_id=self.user.id_for_audit
+                ) for i_user_id in i_user_ids.values()])
+            users = [User(id=self._uuid(), username=login_name, i_user_id=i_user_ids[login_name])
+                     for login_name in batch]
+            User.objects.bulk_create(users)
+            PolicyHolderUser.objects.bulk_create([PolicyHolderUser(
+                id=self._uuid(),
+                user=user,
+                policy_holder_id=login_names[user.username],
+                **self._history_fields(),
+            ) for user in users])
+        self._report(PolicyHolderUser, len(login_names))
+
+    def _generate_workers(self, policyholder_ids, workers_per_policyholder, first_idnp):
+        """
+        Returns the worker ids by economic unit. National ids are consecutive from first_idnp, with their check digit.
+        """
+        workers = {}
+        worker_policyholders = (policyholder_id for policyholder_id in policyholder_ids
+                                for _index in range(workers_per_policyholder))
+        count = 0
+        for batch in _batches(worker_policyholders, self.batch_size):
+            insurees = []
+            for policyholder_id in batch:
+                idnp = str(first_idnp + count)
+                insurees.append(Insuree(
+                    uuid=str(self._uuid()),
+                    chf_id=idnp + str(get_idnp_crc(idnp)),
+                    other_names=f"Worker {count}",
+                    last_name="Load test",
+                    dob=datetime.date(1960, 1, 1) + datetime.datetimedelta(days=self.rng.randint(0, 15000)),
+                    audit_user_id=self.user.id_for_audit,
+                ))
+                count += 1
+            bulk_create_with_ids(Insuree, insurees, 'uuid')
+            memberships = []
+            for policyholder_id, insuree in zip(batch, insurees):
+                workers.setdefault(policyholder_id, []).append(insuree.id)
+                memberships.append(PolicyHolderInsuree(
+                    id=self._uuid(),
+                    policy_holder_id=policyholder_id,
+                    insuree_id=insuree.id,
+                    **self._history_fields(),
+                ))
+            PolicyHolderInsuree.objects.bulk_create(memberships)
+        self._report(Insuree, count)
+        return workers
+
+    def _generate_groups(self, workers, groups_per_policyholder):
+        if not groups_per_policyholder:
+            return
+        groups = [GroupOfWorker(
+            id=self._uuid(),
+            name=f"Load test group {index}",
+            policyholder_id=policyholder_id,
+            **self._history_fields(),
+        ) for policyholder_id in workers for index in range(groups_per_policyholder)]
+        self._insert(GroupOfWorker, groups)
+
+        groups_by_policyholder = {}
+        for group in groups:
+            groups_by_policyholder.setdefault(group.policyholder_id, []).append(group.id)
+        self._insert(WorkerGroup, (WorkerGroup(
+            id=self._uuid(),
+            group_id=self.rng.choice(groups_by_policyholder[policyholder_id]),
+            insuree_id=insuree_id,
+            **self._history_fields(),
+        ) for policyholder_id, insuree_ids in workers.items() for insuree_id in insuree_ids))
+
+    def _generate_vouchers(self, workers, vouchers_per_worker, years, unassigned_per_policyholder):
+        statuses = list(self.VOUCHER_STATUS_WEIGHTS)
+        weights = list(self.VOUCHER_STATUS_WEIGHTS.values())
+        current_year = self.now.year
+
+        def assigned_vouchers():
+            for policyholder_id, insuree_ids in workers.items():
+                for insuree_id in insuree_ids:
+                    for year in range(current_year - years + 1, current_year + 1):
+                        # Distinct days, a worker has at most one voucher per day in an economic unit
+                        for day in self.rng.sample(range(365), vouchers_per_worker):
+                            yield self._voucher(
+                                policyholder_id,
+                                insuree_id,
+                                self.rng.choices(statuses, weights)[0],
+                                datetime.datetime(year, 1, 1) + datetime.datetimedelta(days=day),
+                                datetime.datetime(year, 12, 31, 23, 59, 59),
+                            )
+
+        def unassigned_vouchers():
+            for policyholder_id in workers:
+                for _index in range(unassigned_per_policyholder):
+                    yield self._voucher(policyholder_id, None, WorkerVoucher.Status.UNASSIGNED, None,
+                                        datetime.datetime(current_year, 12, 31, 23, 59, 59))
+
+        self._insert(WorkerVoucher, assigned_vouchers())
+        self._insert(WorkerVoucher, unassigned_vouchers())
+
+    def _voucher(self, policyholder_id, insuree_id, status, assigned_date, expiry_date):
+        voucher_id = self._uuid()
+        return WorkerVoucher(
+            id=voucher_id,
+            code=str(voucher_id),
+            policyholder_id=policyholder_id,
+            insuree_id=insuree_id,
+            status=status,
+            assigned_date=assigned_date,
+            expiry_date=expiry_date,
+            **self._history_fields(),
+        )
+
+    def _insert(self, model, objects):
+        count = 0
+        for batch in _batches(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        self._report(model, count)
+
+    def _report(self, model, count):
+        self.stdout.write(self.style.SUCCESS(f"Generated {count} {model._meta.verbose_name_plural}"))
+
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _history_fields(self):
+        return {
+            'user_created': self.user,
+            'user_updated': self.user,
+            'date_created': self.now,
+            'date_updated': self.now,
+        }
+
+
+def _batches(items, batch_size):
+    iterator = iter(items)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from worker_voucher.tasks import process_worker_uploads
+
+
+class Command(BaseCommand):
+    help = "This command processes the queued worker uploads. Use it on deployments that disable " \
+           "worker_upload_background_thread or to drain the queue after a restart."
+
+    def handle(self, *args, **options):
+        processed = process_worker_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} worker upload(s)"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from worker_voucher.tasks import release_overdue_voucher_bills
+
+
+class Command(BaseCommand):
+    help = "This command cancels the voucher bills unpaid after their due date together with their " \
+           "AWAITING_PAYMENT vouchers, releasing the yearly voucher limit of the workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", type=str, default=None,
+                            help="User recorded as the author of the change, the administrator by default")
+
+    def handle(self, *args, **options):
+        released = release_overdue_voucher_bills(options["username"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Canceled {released['bills']} bill(s) and {released['vouchers']} voucher(s)"))
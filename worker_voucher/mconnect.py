@@ -0,0 +1,190 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable
+
+from django.core.cache import caches
+from django.db import connection
+from django.utils.translation import gettext as _
+
+from worker_voucher.apps import WorkerVoucherConfig
+
+
+# Bump the version when the cached fields or the key change, entries of the previous version are then ignored
+CACHE_KEY_PREFIX = "worker_voucher_mconnect_v2_"
+CACHE_HITS_KEY = "worker_voucher_mconnect_cache_hits"
+CACHE_MISSES_KEY = "worker_voucher_mconnect_cache_misses"
+# Only the fields used by this module (names, date of birth and photo) of successful lookups are cached
+CACHED_FIELDS = ("GivenName", "FamilyName", "DateOfBirth", "Photo")
+
+
+def get_cached_worker_data(chf_ids: Iterable[str], policyholder) -> Dict[str, dict]:
+    """
+    Returns the MConnect worker data found in the cache by national id. Entries are kept by economic unit,
+    data fetched for one economic unit is never returned to the users of another one.
+    """
+    if not WorkerVoucherConfig.mconnect_cache_ttl:
+        return {}
+    keys = {chf_id: _cache_key(chf_id, policyholder) for chf_id in chf_ids}
+    cached = _get_cache().get_many(list(keys.values()))
+    found = {chf_id: cached[key] for chf_id, key in keys.items() if key in cached}
+    _count(CACHE_HITS_KEY, len(found))
+    _count(CACHE_MISSES_KEY, len(keys) - len(found))
+    return found
+
+
+def get_worker_data_cache_stats() -> Dict[str, int]:
+    """
+    Hits and misses of the MConnect worker data cache, counted by every process sharing the cache.
+    """
+    counters = _get_cache().get_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
+    return {"hits": counters.get(CACHE_HITS_KEY, 0), "misses": counters.get(CACHE_MISSES_KEY, 0)}
+
+
+def _cache_worker_data(chf_id, policyholder, data: dict):
+    ttl = WorkerVoucherConfig.mconnect_cache_ttl
+    if ttl:
+        _get_cache().set(_cache_key(chf_id, policyholder),
+                         {field: data.get(field) for field in CACHED_FIELDS}, ttl)
+
+
+def _count(key, delta):
+    if not delta:
+        return
+    worker_data_cache = _get_cache()
+    worker_data_cache.add(key, 0, None)
+    try:
+        worker_data_cache.incr(key, delta)
+    except ValueError:
+        # The counter was evicted right after it was added, this count is lost
+        pass
+
+
+def _cache_key(chf_id, policyholder):
+    return f"{CACHE_KEY_PREFIX}{getattr(policyholder, 'id', None)}_{chf_id}"
+
+
+def _get_cache():
+    return caches[WorkerVoucherConfig.mconnect_cache_alias]
+
+
+def fetch_worker_online_data(chf_id, user, policyholder, service_class=None) -> dict:
+    """
+    fetch_worker_data of MConnectWorkerService served from the cache when possible.
+    """
+    data = get_cached_worker_data([chf_id], policyholder).get(chf_id)
+    if data is not None:
+        return {"success": True, "data": data}
+    return _fetch_and_cache(chf_id, user, policyholder, service_class)
+
+
+def _fetch_and_cache(chf_id, user, policyholder, service_class=None) -> dict:
+    if service_class is None:
+        # Imported on first use, the MConnect client is not needed by processes that never call it
+        from msystems.services.mconnect_worker_service import MConnectWorkerService
+        service_class = MConnectWorkerService
+    online_result = service_class().fetch_worker_data(chf_id, user, policyholder)
+    if online_result.get("success", False):
+        _cache_worker_data(chf_id, policyholder, online_result["data"])
+    return online_result
+
+
+class RateLimiter:
+    """
+    Spaces out the start of calls shared by several threads so that at most `rate` calls start per second.
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Pool shared by every call of the process, so that mconnect_concurrency bounds the MConnect calls running
+    at once overall, calls that timed out but still wait for MConnect included.
+    """
+    global _executor
+    max_workers = max(1, WorkerVoucherConfig.mconnect_concurrency)
+    with _executor_lock:
+        if _executor is None or _executor._max_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mconnect")
+        return _executor
+
+
+def fetch_workers_online_data(chf_ids: Iterable[str], user, policyholder, service_class=None) -> Dict[str, dict]:
+    """
+    Calls fetch_worker_data for every national id on the shared pool of mconnect_concurrency threads and returns
+    the results by national id. National ids found in the cache are not fetched. Calls still running
+    mconnect_timeout seconds after they started are reported as failed, they are not waited for. Calls that could
+    not start because no call finished for mconnect_timeout seconds are cancelled and reported as failed as well.
+    """
+    chf_ids = list(dict.fromkeys(chf_ids))
+    results = {chf_id: {"success": True, "data": data} for chf_id, data in get_cached_worker_data(chf_ids, policyholder).items()}
+    chf_ids_to_fetch = [chf_id for chf_id in chf_ids if chf_id not in results]
+    if not chf_ids_to_fetch:
+        return results
+
+    timeout = WorkerVoucherConfig.mconnect_timeout
+    rate_limiter = RateLimiter(WorkerVoucherConfig.mconnect_rate_limit)
+    started = {}
+
+    def fetch(chf_id):
+        rate_limiter.wait()
+        started[chf_id] = time.monotonic()
+        try:
+            return _fetch_and_cache(chf_id, user, policyholder, service_class)
+        finally:
+            # The pool threads must not keep their own database connections open
+            connection.close()
+
+    executor = _get_executor()
+    pending = {executor.submit(fetch, chf_id): chf_id for chf_id in chf_ids_to_fetch}
+    last_progress = time.monotonic()
+    try:
+        while pending:
+            now = time.monotonic()
+            for future, chf_id in list(pending.items()):
+                if chf_id in started and not future.done() and now - started[chf_id] > timeout:
+                    results[chf_id] = {"success": False, "error": _("worker_voucher.mconnect.timeout")}
+                    del pending[future]
+                elif chf_id not in started and now - last_progress > timeout and future.cancel():
+                    # The pool is taken by calls MConnect does not answer
+                    results[chf_id] = {"success": False, "error": _("worker_voucher.mconnect.timeout")}
+                    del pending[future]
+            if not pending:
+                break
+            deadlines = [started[chf_id] + timeout - now for chf_id in pending.values() if chf_id in started]
+            deadlines.append(last_progress + timeout - now)
+            done, _not_done = wait(pending, timeout=max(min(deadlines), 0.01), return_when=FIRST_COMPLETED)
+            if done:
+                last_progress = time.monotonic()
+            for future in done:
+                chf_id = pending.pop(future)
+                try:
+                    results[chf_id] = future.result()
+                except Exception as exc:
+                    results[chf_id] = {"success": False, "error": str(exc)}
+    finally:
+        # Not started calls are dropped, running ones finish in the background
+        for future in pending:
+            future.cancel()
+    return results
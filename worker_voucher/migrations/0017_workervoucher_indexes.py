@@ -0,0 +1,21 @@
+# Generated by Django 4.2.15 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worker_voucher', '0016_group_search_all_rights'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workervoucher',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('status__in', ['ASSIGNED', 'AWAITING_PAYMENT'])), fields=['insuree', 'policyholder', 'assigned_date'], name='worker_vouch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workervoucher',
+            index=models.Index(condition=models.Q(('insuree__isnull', True)), fields=['policyholder', 'status', 'expiry_date'], name='worker_vouch_unassigned_idx'),
+        ),
+    ]
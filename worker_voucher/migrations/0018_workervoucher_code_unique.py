@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-17 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worker_voucher', '0017_workervoucher_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='workervoucher',
+            constraint=models.UniqueConstraint(condition=models.Q(('code__isnull', False)), fields=('code',), name='worker_vouch_code_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.15 on 2026-10-17 13:20
+
+from django.db import migrations, models
+
+BILL_SUBJECT_INDEX = models.Index(fields=['subject_id'], name='worker_vouch_bill_subject_idx')
+
+
+def create_bill_subject_index(apps, schema_editor):
+    # tblBill belongs to the invoice module, the index is created outside of its model state: invoice migrations
+    # do not know about it, later ALTERs of SubjectId have to drop and recreate it
+    schema_editor.add_index(apps.get_model('invoice', 'Bill'), BILL_SUBJECT_INDEX)
+
+
+def drop_bill_subject_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('invoice', 'Bill'), BILL_SUBJECT_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0013_alter_bill_code_ext_alter_bill_code_tp_and_more'),
+        ('worker_voucher', '0018_workervoucher_code_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_bill_subject_index, drop_bill_subject_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.15 on 2026-10-17 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worker_voucher', '0019_bill_subject_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerUploadRowError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row', models.IntegerField()),
+                ('errors', models.JSONField()),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='row_errors', to='worker_voucher.workerupload')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='workeruploadrowerror',
+            constraint=models.UniqueConstraint(fields=('upload', 'row'), name='worker_upload_row_error_unique'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from core.models import HistoryModel, HistoryBusinessModel
@@ -25,6 +26,21 @@ class WorkerVoucher(HistoryModel):
     assigned_date = fields.DateTimeField(blank=True, null=True)
     expiry_date = fields.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Active vouchers of a worker: existing voucher checks, yearly limits, worker enquire
+            models.Index(fields=['insuree', 'policyholder', 'assigned_date'],
+                         name='worker_vouch_active_idx',
+                         condition=Q(is_deleted=False, status__in=['ASSIGNED', 'AWAITING_PAYMENT'])),
+            # Unassigned voucher pool of an economic unit, ordered by expiry
+            models.Index(fields=['policyholder', 'status', 'expiry_date'],
+                         name='worker_vouch_unassigned_idx',
+                         condition=Q(insuree__isnull=True)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['code'], name='worker_vouch_code_unique', condition=Q(code__isnull=False)),
+        ]
+
     @classmethod
     def get_queryset(cls, queryset, user):
         from worker_voucher.services import get_voucher_user_filters
@@ -53,6 +69,21 @@ class WorkerUpload(HistoryModel):
     file_name = models.CharField(max_length=255, null=True, blank=True)
 
 
+class WorkerUploadRowError(models.Model):
+    """
+    Errors of one row of a worker upload, written with the chunk of the row. A resumed upload reads them back for
+    the rows committed before its checkpoint.
+    """
+    upload = models.ForeignKey(WorkerUpload, models.CASCADE, related_name='row_errors')
+    row = models.IntegerField()
+    errors = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'row'], name='worker_upload_row_error_unique'),
+        ]
+
+
 class GroupOfWorker(HistoryModel):
     name = models.CharField(max_length=50)
     policyholder = models.ForeignKey(PolicyHolder, models.DO_NOTHING, null=True, blank=True)
@@ -15,9 +15,9 @@ from insuree.apps import InsureeConfig
 from insuree.gql_queries import InsureeGQLType
 from insuree.models import Insuree
 from insuree.services import custom_insuree_number_validation
-from msystems.services.mconnect_worker_service import MConnectWorkerService
 from policyholder.models import PolicyHolder
 from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.mconnect import fetch_worker_online_data
 from worker_voucher.gql_queries import WorkerVoucherGQLType, AcquireVouchersValidationSummaryGQLType, WorkerGQLType, \
     OnlineWorkerDataGQLType, GroupOfWorkerGQLType, WorkerGroupGQLType, VoucherCheckGQLType
 from worker_voucher.gql_mutations import CreateWorkerVoucherMutation, UpdateWorkerVoucherMutation, \
@@ -27,6 +27,7 @@ from worker_voucher.gql_mutations import CreateWorkerVoucherMutation, UpdateWork
 from worker_voucher.models import WorkerVoucher, GroupOfWorker, WorkerGroup
 from worker_voucher.services import (
     get_voucher_worker_enquire_filters,
+    get_voucher_check_data,
     validate_acquire_unassigned_vouchers,
     validate_acquire_assigned_vouchers,
     validate_assign_vouchers,
@@ -219,7 +220,7 @@ class Query(ExportableQueryMixin, graphene.ObjectType):
             if errors:
                 raise AttributeError(_("Insuree number not valid"))
 
-        online_result = MConnectWorkerService().fetch_worker_data(national_id, info.context.user, eu)
+        online_result = fetch_worker_online_data(national_id, info.context.user, eu)
         if not online_result.get("success", False):
             raise AttributeError(online_result.get("error", _("Unknown Error")))
 
@@ -246,14 +247,7 @@ class Query(ExportableQueryMixin, graphene.ObjectType):
         try:
             from core import datetime
             today = datetime.datetime.now()
-            voucher = WorkerVoucher.objects.filter(
-                code=code,
-                insuree__validity_to__isnull=True,
-                policyholder__is_deleted=False,
-                is_deleted=False,
-                expiry_date__gte=today,
-                status=WorkerVoucher.Status.ASSIGNED
-            ).first()
+            voucher = get_voucher_check_data(code)
             if not voucher:
                 return VoucherCheckGQLType(
                     is_existed=False,
@@ -262,22 +256,13 @@ class Query(ExportableQueryMixin, graphene.ObjectType):
                     employer_code=None,
                     employer_name=None,
                 )
-            if voucher.assigned_date.date() >= today.date():
-                return VoucherCheckGQLType(
-                    is_existed=True,
-                    is_valid=True,
-                    assigned_date=voucher.assigned_date,
-                    employer_code=voucher.policyholder.code,
-                    employer_name=voucher.policyholder.trade_name
-                )
-            else:
-                return VoucherCheckGQLType(
-                    is_existed=True,
-                    is_valid=False,
-                    assigned_date=voucher.assigned_date,
-                    employer_code=voucher.policyholder.code,
-                    employer_name=voucher.policyholder.trade_name
-                )
+            return VoucherCheckGQLType(
+                is_existed=True,
+                is_valid=voucher['assigned_date'].date() >= today.date(),
+                assigned_date=voucher['assigned_date'],
+                employer_code=voucher['employer_code'],
+                employer_name=voucher['employer_name']
+            )
         except Exception:
             raise ValidationError(_("Unable to fetch voucher details"))
 
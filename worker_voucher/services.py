@@ -1,33 +1,36 @@
+import hashlib
 import logging
-import pandas as pd
-from io import BytesIO
+from collections import Counter
 from decimal import Decimal
-from typing import Iterable, Dict, Union, List
+from typing import Iterable, Dict, Union, List, Optional
 from uuid import uuid4
 
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q, QuerySet, UUIDField, Count
-from django.db.models.functions import Cast
+from django.db.models import Q, QuerySet, UUIDField, Count, F
+from django.db.models.functions import Cast, ExtractYear
 from django.utils.translation import gettext as _
 
 from core import datetime
 from core.models import InteractiveUser, User
 from core.services import BaseService
 from core.services.utils import (
+    check_authentication,
+    get_generic_type,
     output_exception,
     model_representation,
     output_result_success
 )
-from core.signals import register_service_signal
+from core.signals import register_service_signal, REGISTERED_SERVICE_SIGNALS
 from insuree.models import Insuree
-from insuree.gql_mutations import update_or_create_insuree
-from invoice.models import Bill
+from invoice.models import Bill, BillItem
 from invoice.services import BillService
-from policyholder.models import PolicyHolder, PolicyHolderInsuree
-from policyholder.services import PolicyHolderInsuree as PolicyHolderInsureeService
-from msystems.services.mconnect_worker_service import MConnectWorkerService
+from policyholder.models import PolicyHolder
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.authorization import get_user_authorization_context
 from worker_voucher.models import WorkerVoucher, GroupOfWorker, WorkerGroup
 from worker_voucher.validation import WorkerVoucherValidation
 
@@ -56,39 +59,190 @@ class WorkerVoucherService(BaseService):
     def delete(self, obj_data):
         return super().delete(obj_data)
 
+    @register_service_signal('worker_voucher_service.bulk_create')
+    @check_authentication
+    def bulk_create(self, obj_data_list):
+        """
+        Batch counterpart of create. Receivers of worker_voucher_service.bulk_create get the whole payload list in
+        a single signal call. Receivers of worker_voucher_service.create are still called for every voucher, with
+        the same arguments and result as for a single create.
+        """
+        create_signal = REGISTERED_SERVICE_SIGNALS['worker_voucher_service.create']
+        try:
+            with transaction.atomic():
+                now = datetime.datetime.now()
+                vouchers = []
+                for payload in obj_data_list:
+                    create_signal.send_signal_before(sender=self, **self._create_signal_args(payload))
+                    obj_data = self._adjust_create_payload(payload)
+                    self.validation_class.validate_create(self.user, **obj_data)
+                    vouchers.append(self.OBJECT_TYPE(
+                        id=uuid4(),
+                        user_created=self.user,
+                        user_updated=self.user,
+                        date_created=now,
+                        date_updated=now,
+                        **obj_data
+                    ))
+                bulk_create_with_history(vouchers, self.OBJECT_TYPE,
+                                         batch_size=WorkerVoucherConfig.voucher_bulk_batch_size,
+                                         default_user=self.user)
+                for payload, voucher in zip(obj_data_list, vouchers):
+                    create_signal.send_signal_after(
+                        sender=self, **self._create_signal_args(payload),
+                        result=output_result_success(dict_representation=model_representation(voucher)))
+                return output_result_success(dict_representation={
+                    "vouchers": [{"id": voucher.id, "code": voucher.code} for voucher in vouchers]
+                })
+        except Exception as exc:
+            return output_exception(model_name=self.OBJECT_TYPE.__name__, method="bulk_create", exception=exc)
+
+    def _create_signal_args(self, obj_data):
+        # Arguments register_service_signal passes to the receivers of a create(obj_data) call
+        return {"cls_": self, "data": [(obj_data,), {}], "context": None}
+
+    @register_service_signal('worker_voucher_service.bulk_update')
+    @check_authentication
+    def bulk_update(self, obj_data_list):
+        """
+        Batch counterpart of update. All vouchers are read with one query and written back with batched UPDATEs,
+        history rows are inserted in bulk.
+        """
+        try:
+            with transaction.atomic():
+                obj_data_list = [self._adjust_update_payload(obj_data) for obj_data in obj_data_list]
+                for obj_data in obj_data_list:
+                    self.validation_class.validate_update(self.user, **obj_data)
+                vouchers = {str(voucher.id): voucher for voucher in
+                            self.OBJECT_TYPE.objects.filter(id__in=[obj_data["id"] for obj_data in obj_data_list])}
+
+                now = datetime.datetime.now()
+                fields = {"user_updated", "date_updated", "version"}
+                for obj_data in obj_data_list:
+                    voucher = vouchers[str(obj_data["id"])]
+                    for key, value in obj_data.items():
+                        if key != "id":
+                            setattr(voucher, key, value)
+                            fields.add(key)
+                    voucher.user_updated = self.user
+                    voucher.date_updated = now
+                    voucher.version = voucher.version + 1
+
+                bulk_update_with_history(list(vouchers.values()), self.OBJECT_TYPE, list(fields),
+                                         batch_size=WorkerVoucherConfig.voucher_bulk_batch_size,
+                                         default_user=self.user)
+                return output_result_success(dict_representation={"ids": list(vouchers)})
+        except Exception as exc:
+            return output_exception(model_name=self.OBJECT_TYPE.__name__, method="bulk_update", exception=exc)
+
 
 def get_voucher_worker_enquire_filters(national_id: str) -> Iterable[Q]:
-    today = datetime.datetime.now()
+    now = datetime.datetime.now()
+    today = datetime.datetime(now.year, now.month, now.day)
 
+    # A range instead of assigned_date__date, casting the column would keep the index on it from being used
     return [Q(
         insuree__chf_id=national_id,
         insuree__validity_to__isnull=True,
         policyholder__is_deleted=False,
         is_deleted=False,
         status=WorkerVoucher.Status.ASSIGNED,
-        assigned_date__date=today,
-        expiry_date__gte=today,
+        assigned_date__gte=today,
+        assigned_date__lt=today + datetime.datetimedelta(days=1),
+        expiry_date__gte=now,
     )]
 
 
+def get_voucher_check_data(code: str) -> Optional[Dict]:
+    """
+    Returns assigned_date, expiry_date, employer_code and employer_name of an active assigned voucher,
+    or None if there is no such voucher. Lookups are cached for voucher_check_cache_ttl seconds.
+    """
+    cache_key = _get_voucher_check_cache_key(code)
+    voucher = cache.get(cache_key)
+    if voucher is None:
+        voucher = WorkerVoucher.objects.filter(
+            code=code,
+            insuree__validity_to__isnull=True,
+            policyholder__is_deleted=False,
+            is_deleted=False,
+            status=WorkerVoucher.Status.ASSIGNED
+        ).values(
+            'assigned_date',
+            'expiry_date',
+            employer_code=F('policyholder__code'),
+            employer_name=F('policyholder__trade_name'),
+        ).first() or {}
+        # Misses are cached as well, as an empty dict
+        cache.set(cache_key, voucher, WorkerVoucherConfig.voucher_check_cache_ttl)
+
+    if not voucher or not voucher['expiry_date'] or voucher['expiry_date'] < datetime.datetime.now():
+        return None
+    return voucher
+
+
+def invalidate_voucher_check_cache(codes: Iterable[str]):
+    cache.delete_many([_get_voucher_check_cache_key(code) for code in codes if code])
+
+
+def _get_voucher_check_cache_key(code: str):
+    # Codes come from user input, hashing keeps the key valid for every cache backend
+    return f"worker_voucher_check_{hashlib.sha1(str(code).encode()).hexdigest()}"
+
+
+def expire_past_vouchers(user: User, now: datetime.datetime = None) -> int:
+    """
+    Moves UNASSIGNED vouchers, and ASSIGNED vouchers assigned in a past year, whose expiry date has passed
+    to EXPIRED and returns how many were moved. Vouchers assigned in the current year stay ASSIGNED, they still
+    count toward the yearly worker voucher limit and block their assigned date.
+    """
+    now = now or datetime.datetime.now()
+    queryset = WorkerVoucher.objects.filter(
+        Q(status=WorkerVoucher.Status.UNASSIGNED)
+        | Q(status=WorkerVoucher.Status.ASSIGNED, assigned_date__lt=datetime.datetime(now.year, 1, 1)),
+        is_deleted=False,
+        expiry_date__lt=now,
+    )
+    return update_vouchers_status(queryset, WorkerVoucher.Status.EXPIRED, user, now)
+
+
+def update_vouchers_status(queryset: QuerySet, status: str, user: User, now: datetime.datetime = None) -> int:
+    """
+    Moves the vouchers of the queryset to the given status with one UPDATE per voucher_bulk_batch_size vouchers,
+    history rows are inserted in bulk. Returns the number of vouchers updated. The queryset must not match the
+    vouchers once they are updated, batches are taken from it until it is empty.
+    """
+    now = now or datetime.datetime.now()
+    batch_size = WorkerVoucherConfig.voucher_bulk_batch_size
+    updated = 0
+    while True:
+        with transaction.atomic():
+            batch = dict(queryset.order_by().values_list('id', 'code')[:batch_size])
+            if not batch:
+                return updated
+            # The conditions are applied again, vouchers changed since the batch was read are left out
+            updated += queryset.filter(id__in=batch).update(
+                status=status, user_updated=user, date_updated=now, version=F('version') + 1)
+            vouchers = list(WorkerVoucher.objects.filter(id__in=batch, status=status))
+            WorkerVoucher.history.bulk_history_create(
+                vouchers, batch_size=batch_size, update=True, default_user=user, default_date=now)
+            WorkerVoucher.bulk_update_cache(vouchers)
+        # UPDATE does not send post_save, cached voucher checks are dropped here
+        invalidate_voucher_check_cache(batch.values())
+
+
 def get_voucher_user_filters(user: InteractiveUser) -> Iterable[Q]:
-    return [Q(
-        policyholder__policyholderuser__user__i_user=user,
-        policyholder__is_deleted=False,
-        policyholder__policyholderuser__is_deleted=False,
-        policyholder__policyholderuser__user__validity_to__isnull=True,
-        policyholder__policyholderuser__user__i_user__validity_to__isnull=True,
-    )] if not user.user.has_perms(WorkerVoucherConfig.gql_worker_voucher_search_all_perms) else []
+    authorization = get_user_authorization_context(user)
+    if authorization.has_perms(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
+        return []
+    return [Q(policyholder_id__in=authorization.policyholder_ids)]
 
 
 def get_group_worker_user_filters(user: InteractiveUser) -> Iterable[Q]:
-    return [Q(
-        policyholder__policyholderuser__user__i_user=user.i_user,
-        policyholder__is_deleted=False,
-        policyholder__policyholderuser__is_deleted=False,
-        policyholder__policyholderuser__user__validity_to__isnull=True,
-        policyholder__policyholderuser__user__i_user__validity_to__isnull=True,
-    )] if not user.has_perms(WorkerVoucherConfig.gql_group_of_worker_search_all_perms) else []
+    authorization = get_user_authorization_context(user)
+    if authorization.has_perms(WorkerVoucherConfig.gql_group_of_worker_search_all_perms):
+        return []
+    return [Q(policyholder_id__in=authorization.policyholder_ids)]
 
 
 def validate_acquire_unassigned_vouchers(user: User, eu_code: str, count: Union[int, str]) -> Dict:
@@ -125,11 +279,7 @@ def validate_acquire_assigned_vouchers(user: User, eu_code: str, workers: List[s
         dates = _check_dates(date_ranges)
         vouchers_per_insuree_count = len(dates)
         check_existing_active_vouchers(ph, insurees, dates)
-        for insuree in insurees:
-            years = {date.year for date in dates}
-            for year in years:
-                count = sum(1 for d in dates if d.year == year)
-                _check_voucher_limit(insuree, user, ph, year, count)
+        _check_voucher_limits(insurees, user, ph, dates)
         count = insurees_count * vouchers_per_insuree_count
         return {
             "success": True,
@@ -153,11 +303,7 @@ def validate_assign_vouchers(user: User, eu_code: str, workers: List[str], date_
         insurees_count = len(insurees)
         dates = _check_dates(date_ranges)
         vouchers_per_insuree_count = len(dates)
-        for insuree in insurees:
-            years = {date.year for date in dates}
-            for year in years:
-                count = sum(1 for d in dates if d.year == year)
-                _check_voucher_limit(insuree, user, ph, year, count)
+        _check_voucher_limits(insurees, user, ph, dates)
         check_existing_active_vouchers(ph, insurees, dates)
         count = insurees_count * vouchers_per_insuree_count
         unassigned_vouchers = _check_unassigned_vouchers(ph, dates, count)
@@ -187,56 +333,114 @@ def _check_ph(user: User, eu_code: str):
 
 
 def _check_insurees(workers: List[str], eu_code: str, user: User):
-    insurees = set()
+    insurees_by_chf_id = {ins.chf_id: ins for ins in Insuree.objects.filter(
+        worker_user_filter(user, economic_unit_code=eu_code),
+        chf_id__in=set(workers),
+        validity_to__isnull=True,
+    ).distinct()}
+
+    missing = set(workers) - insurees_by_chf_id.keys()
+    seen = set()
     for code in workers:
-        try:
-            ins = Insuree.objects.get(
-                worker_user_filter(user, economic_unit_code=eu_code),
-                chf_id=code,
-                validity_to__isnull=True,
-            )
-        except Insuree.DoesNotExist:
+        # Checked in input order, so the first invalid entry is reported as before
+        if code in missing:
             raise VoucherException(_(f"Worker {code} does not exists"))
-        if ins in insurees:
+        if code in seen:
             raise VoucherException(_(f"Duplicate worker: {code}"))
-        else:
-            insurees.add(ins)
+        seen.add(code)
+
+    insurees = {insurees_by_chf_id[code] for code in seen}
     if not insurees:
         raise VoucherException(_("No valid workers"))
     return insurees
 
 
-def _check_voucher_limit(insuree, user, policyholder, year, count=1):
-    voucher_counts = get_worker_yearly_voucher_count_counts(insuree, user, year)
+def _check_voucher_limits(insurees, user, policyholder, dates):
+    new_counts = dates.count_by_year()
+    voucher_counts = get_workers_yearly_voucher_counts(insurees, user, new_counts.keys())
+
+    over_limit = sorted(
+        insuree.chf_id for insuree in insurees
+        if any(voucher_counts.get((insuree.id, policyholder.code, year), 0) + count
+               > WorkerVoucherConfig.yearly_worker_voucher_limit for year, count in new_counts.items())
+    )
+    if len(over_limit) == 1:
+        raise VoucherException(_(f"Worker {over_limit[0]} reached yearly voucher limit"))
+    if over_limit:
+        raise VoucherException(_(f"Workers {', '.join(over_limit)} reached yearly voucher limit"))
+
+
+class VoucherDateRanges:
+    """
+    Sorted, non-overlapping inclusive date ranges. Individual days are only generated when iterating,
+    e.g. while minting vouchers.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = sorted(ranges)
 
-    if voucher_counts.get(policyholder.code, 0) + count > WorkerVoucherConfig.yearly_worker_voucher_limit:
-        raise VoucherException(_(f"Worker {insuree.chf_id} reached yearly voucher limit"))
+    def __len__(self):
+        return sum((end_date - start_date).days + 1 for start_date, end_date in self.ranges)
+
+    def __iter__(self):
+        for start_date, end_date in self.ranges:
+            for n in range((end_date - start_date).days + 1):
+                yield start_date + datetime.datetimedelta(days=n)
+
+    @property
+    def start(self):
+        return self.ranges[0][0]
+
+    @property
+    def end(self):
+        return self.ranges[-1][1]
+
+    def count_by_year(self) -> Dict[int, int]:
+        counts = Counter()
+        for start_date, end_date in self.ranges:
+            for year in range(start_date.year, end_date.year + 1):
+                year_start = max(start_date, datetime.date(year, 1, 1))
+                year_end = min(end_date, datetime.date(year, 12, 31))
+                counts[year] += (year_end - year_start).days + 1
+        return counts
+
+    def as_q(self, field_name) -> Q:
+        q = Q()
+        for start_date, end_date in self.ranges:
+            q |= Q(**{f'{field_name}__gte': start_date,
+                      f'{field_name}__lt': end_date + datetime.datetimedelta(days=1)})
+        return q
 
 
 def _check_dates(date_ranges: List[Dict]):
-    max_date = _get_voucher_expiry_date(datetime.date.today())
-    dates = set()
+    today = datetime.date.today()
+    max_date = _get_voucher_expiry_date(today)
+    ranges = []
     for date_range in date_ranges:
         start_date, end_date = (datetime.date.from_ad_date(date_range.get("start_date")),
                                 datetime.date.from_ad_date(date_range.get("end_date")))
-        if start_date < datetime.date.today():
+        if start_date < today:
             raise VoucherException(_(f"Date {start_date} is in the past"))
         if start_date > end_date:
             raise VoucherException(_(f"Start date {start_date} is after end date {end_date}"))
-
-        day_count = (end_date - start_date).days + 1
-        for date in (start_date + datetime.datetimedelta(days=n) for n in
-                     range(day_count)):
-            if date in dates:
-                raise VoucherException(_(f"Date {date} in more than one range"))
-            if date > max_date:
-                raise VoucherException(_(f"Date {date} after voucher expiry date"))
-            else:
-                dates.add(date)
-    if not dates:
+        ranges.append((start_date, end_date))
+    if not ranges:
         raise VoucherException(_(f"No valid dates"))
+
+    dates = VoucherDateRanges(ranges)
+    # Ranges are sorted by start date, so an overlap can only occur between neighbouring ranges
+    last_end_date = None
+    for start_date, end_date in dates.ranges:
+        if last_end_date is not None and start_date <= last_end_date:
+            raise VoucherException(_(f"Date {start_date} in more than one range"))
+        last_end_date = end_date
+    for start_date, end_date in dates.ranges:
+        if end_date > max_date:
+            date = start_date if start_date > max_date else max_date.date() + datetime.datetimedelta(days=1)
+            raise VoucherException(_(f"Date {date} after voucher expiry date"))
     return dates
 
+
 def _get_voucher_expiry_date(start_date: datetime):
     expiry_type = WorkerVoucherConfig.voucher_expiry_type
 
@@ -252,17 +456,19 @@ def _get_voucher_expiry_date(start_date: datetime):
 
 
 def check_existing_active_vouchers(ph, insurees, dates):
-    if isinstance(dates, set):
-        date_filter = {'assigned_date__in': dates}
+    if isinstance(dates, VoucherDateRanges):
+        date_filter = dates.as_q('assigned_date')
+    elif isinstance(dates, set):
+        date_filter = Q(assigned_date__in=dates)
     else:
-        date_filter = {'assigned_date__gte': dates}
+        date_filter = Q(assigned_date__gte=dates)
 
     if WorkerVoucher.objects.filter(
+            date_filter,
             insuree__in=insurees,
             policyholder=ph,
             status__in=(WorkerVoucher.Status.ASSIGNED, WorkerVoucher.Status.AWAITING_PAYMENT),
             is_deleted=False,
-            **date_filter
     ).exists():
         raise VoucherException(_("One or more workers have assigned vouchers in specified ranges"))
 
@@ -273,7 +479,7 @@ def _check_unassigned_vouchers(ph, dates, count):
     unassigned_vouchers = WorkerVoucher.objects.filter(
         insuree=None,
         assigned_date=None,
-        expiry_date__gte=max(dates),
+        expiry_date__gte=dates.end,
         policyholder=ph,
         status=WorkerVoucher.Status.UNASSIGNED,
         is_deleted=False).order_by('expiry_date')[:count]
@@ -294,6 +500,27 @@ def get_worker_yearly_voucher_count_counts(insuree: Insuree, user: User, year):
     return {row["policyholder__code"]: row["count"] for row in res}
 
 
+def get_workers_yearly_voucher_counts(insurees, user: User, years) -> Dict[tuple, int]:
+    """
+    Active voucher counts for all given workers in one grouped query, keyed by (insuree_id, policyholder_code, year)
+    """
+    if not years:
+        return {}
+    res = WorkerVoucher.objects.filter(
+        economic_unit_user_filter(user, prefix="policyholder__"),
+        is_deleted=False,
+        status__in=(WorkerVoucher.Status.ASSIGNED, WorkerVoucher.Status.AWAITING_PAYMENT),
+        insuree__in=insurees,
+        assigned_date__gte=datetime.date(min(years), 1, 1),
+        assigned_date__lt=datetime.date(max(years) + 1, 1, 1),
+    ).annotate(year=ExtractYear("assigned_date")) \
+        .values("insuree_id", "policyholder__code", "year") \
+        .annotate(count=Count("id")) \
+        .order_by()
+
+    return {(row["insuree_id"], row["policyholder__code"], row["year"]): row["count"] for row in res}
+
+
 def create_assigned_voucher(user, date, insuree_id, policyholder_id):
     current_date = datetime.datetime.today()
     expiry_date = _get_voucher_expiry_date(current_date)
@@ -312,6 +539,21 @@ def create_assigned_voucher(user, date, insuree_id, policyholder_id):
         raise VoucherException(service_result["error"])
 
 
+def create_assigned_vouchers(user, dates, insuree_ids, policyholder_id):
+    current_date = datetime.datetime.today()
+    expiry_date = _get_voucher_expiry_date(current_date)
+
+    voucher_service = WorkerVoucherService(user)
+    service_result = voucher_service.bulk_create([{
+        "policyholder_id": policyholder_id,
+        "insuree_id": insuree_id,
+        "code": str(uuid4()),
+        "assigned_date": date,
+        "expiry_date": expiry_date
+    } for date in dates for insuree_id in insuree_ids])
+    return _get_bulk_created_voucher_codes(service_result)
+
+
 def create_unassigned_voucher(user, policyholder_id):
     current_date = datetime.date.today()
     expiry_date = _get_voucher_expiry_date(current_date)
@@ -328,6 +570,27 @@ def create_unassigned_voucher(user, policyholder_id):
         raise VoucherException(service_result["error"])
 
 
+def create_unassigned_vouchers(user, policyholder_id, count):
+    current_date = datetime.date.today()
+    expiry_date = _get_voucher_expiry_date(current_date)
+
+    voucher_service = WorkerVoucherService(user)
+    service_result = voucher_service.bulk_create([{
+        "policyholder_id": policyholder_id,
+        "code": str(uuid4()),
+        "expiry_date": expiry_date
+    } for _ in range(count)])
+    return _get_bulk_created_voucher_codes(service_result)
+
+
+def _get_bulk_created_voucher_codes(service_result):
+    # Returns the created vouchers as {id: code}, so the codes can be passed on to create_voucher_bill
+    if service_result.get("success", False):
+        return {voucher["id"]: voucher["code"] for voucher in service_result.get("data").get("vouchers")}
+    else:
+        raise VoucherException(service_result.get("detail"))
+
+
 def assign_voucher(user, insuree_id, voucher_id, assigned_date):
     # This service function does not check if the voucher is eligible to be assigned
     voucher_service = WorkerVoucherService(user)
@@ -343,8 +606,32 @@ def assign_voucher(user, insuree_id, voucher_id, assigned_date):
         raise VoucherException(service_result["error"])
 
 
-def create_voucher_bill(user, voucher_ids, policyholder_id):
+def assign_vouchers(user, insuree_ids, dates, unassigned_vouchers):
+    # Pairs every (date, insuree) slot with one voucher from the pool, does not check if the vouchers are eligible
+    slots = [(insuree_id, date) for date in dates for insuree_id in insuree_ids]
+    if len(unassigned_vouchers) < len(slots):
+        raise VoucherException(_("Not enough unassigned vouchers"))
+
+    voucher_service = WorkerVoucherService(user)
+    service_result = voucher_service.bulk_update([{
+        "id": voucher.id,
+        "insuree_id": insuree_id,
+        "assigned_date": date,
+        "status": WorkerVoucher.Status.ASSIGNED
+    } for voucher, (insuree_id, date) in zip(unassigned_vouchers, slots)])
+    if service_result.get("success", False):
+        return service_result.get("data").get("ids")
+    else:
+        raise VoucherException(service_result.get("detail"))
+
+
+def create_voucher_bill(user, voucher_ids, policyholder_id, voucher_codes=None):
+    """
+    Creates a single bill for the given vouchers. Voucher codes used in line descriptions can be passed as
+    {voucher_id: code} (e.g. from create_assigned_vouchers), otherwise they are fetched with one query.
+    """
     bill_due_period = WorkerVoucherConfig.voucher_bill_due_period
+    price = Decimal(WorkerVoucherConfig.price_per_voucher)
 
     bill_data = {
         'subject_type': "policyholder",
@@ -354,22 +641,23 @@ def create_voucher_bill(user, voucher_ids, policyholder_id):
         'date_due': datetime.datetime.now() + datetime.datetimedelta(**bill_due_period)
     }
 
-    bill_data_line = []
-
     with transaction.atomic():
-        for voucher_id in voucher_ids:
-            voucher = WorkerVoucher.objects.get(id=voucher_id)
-            price = Decimal(WorkerVoucherConfig.price_per_voucher)
-            bill_data_line.append({
-                "code": str(uuid4()),
-                "description": f"Voucher {voucher.code}",
-                "line_type": "workervoucher",
-                "line_id": voucher_id,
-                "quantity": 1,
-                "unit_price": price,
-                "amount_net": price,
-                "amount_total": price,
-            })
+        if voucher_codes is None:
+            voucher_codes = {str(voucher_id): code for voucher_id, code in
+                             WorkerVoucher.objects.filter(id__in=voucher_ids).values_list('id', 'code')}
+        else:
+            voucher_codes = {str(voucher_id): code for voucher_id, code in voucher_codes.items()}
+
+        bill_data_line = [{
+            "code": str(uuid4()),
+            "description": f"Voucher {voucher_codes[str(voucher_id)]}",
+            "line_type": "workervoucher",
+            "line_id": voucher_id,
+            "quantity": 1,
+            "unit_price": price,
+            "amount_net": price,
+            "amount_total": price,
+        } for voucher_id in voucher_ids]
 
         bill_create_payload = {
             "user": user,
@@ -377,7 +665,118 @@ def create_voucher_bill(user, voucher_ids, policyholder_id):
             "bill_data_line": bill_data_line
         }
 
-        return BillService.bill_create(convert_results=bill_create_payload)
+        return _bill_create_with_bulk_items(bill_create_payload)
+
+
+def _bill_create_with_bulk_items(convert_results):
+    """
+    BillService.bill_create with the line items inserted in bulk instead of one BillLineItemService.create each,
+    so a bill costs the same number of queries however many vouchers it has. Receivers of
+    signal_after_invoice_module_bill_create_service get the same arguments and result as from bill_create.
+    """
+    bill_create_signal = REGISTERED_SERVICE_SIGNALS['signal_after_invoice_module_bill_create_service']
+    signal_args = {"cls_": BillService, "data": [(), {"convert_results": convert_results}], "context": None}
+    bill_create_signal.send_signal_before(sender=BillService, **signal_args)
+
+    user = convert_results['user']
+    bill_service = BillService(user=user)
+    result = bill_service.create(convert_results['bill_data'])
+    if result["success"] is True:
+        now = datetime.datetime.now()
+        bill_items = [BillItem(
+            id=uuid4(),
+            bill_id=result["data"]["id"],
+            user_created=user,
+            user_updated=user,
+            date_created=now,
+            date_updated=now,
+            date_valid_from=now,
+            **{**line, "line_type": get_generic_type(line["line_type"])},
+        ) for line in convert_results['bill_data_line']]
+        bulk_create_with_history(bill_items, BillItem, batch_size=WorkerVoucherConfig.voucher_bulk_batch_size,
+                                 default_user=user)
+        result = bill_service.update({
+            "id": result["data"]["id"],
+            "amount_net": sum((Decimal(item.amount_net) for item in bill_items), Decimal(0)),
+            "amount_total": sum((Decimal(item.amount_total) for item in bill_items), Decimal(0)),
+            "amount_discount": sum((Decimal(item.discount or 0) for item in bill_items), Decimal(0)),
+        })
+    else:
+        # bill_create returns nothing when the bill itself cannot be created
+        result = None
+
+    bill_create_signal.send_signal_after(sender=BillService, **signal_args, result=result)
+    return result
+
+
+def release_unpaid_vouchers(user: User, today: datetime.date = None) -> Dict[str, int]:
+    """
+    Cancels the voucher bills still unpaid after their due date together with their AWAITING_PAYMENT vouchers,
+    which then stop counting against the yearly limit and blocking their dates. Returns the number of bills and
+    vouchers canceled.
+    """
+    today = today or datetime.date.today()
+    now = datetime.datetime.now()
+    batch_size = WorkerVoucherConfig.voucher_bulk_batch_size
+    voucher_type = ContentType.objects.get_for_model(WorkerVoucher)
+    overdue_bills = Bill.objects.filter(
+        is_deleted=False,
+        status=Bill.Status.VALIDATED,
+        date_due__lt=today,
+        line_items_bill__line_type=voucher_type,
+    )
+    released = {"bills": 0, "vouchers": 0}
+    last_bill_id = None
+    while True:
+        with transaction.atomic():
+            candidates = overdue_bills.filter(id__gt=last_bill_id) if last_bill_id else overdue_bills
+            bill_ids = list(candidates.order_by('id').values_list('id', flat=True).distinct()[:batch_size])
+            if not bill_ids:
+                return released
+            last_bill_id = bill_ids[-1]
+            # Locked and checked again, bills paid since they were read or being paid right now are left alone
+            bills = list(Bill.objects.select_for_update(skip_locked=True).filter(
+                id__in=bill_ids, is_deleted=False, status=Bill.Status.VALIDATED))
+            if not bills:
+                continue
+            voucher_ids = BillItem.objects.filter(
+                bill__in=bills, line_type=voucher_type, is_deleted=False).values_list('line_id', flat=True)
+            released["vouchers"] += update_vouchers_status(
+                WorkerVoucher.objects.filter(
+                    id__in=list(voucher_ids), is_deleted=False, status=WorkerVoucher.Status.AWAITING_PAYMENT),
+                WorkerVoucher.Status.CANCELED, user, now)
+
+            for bill in bills:
+                bill.status = Bill.Status.CANCELLED
+                bill.user_updated = user
+                bill.date_updated = now
+                bill.version = bill.version + 1
+            bulk_update_with_history(bills, Bill, ["status", "user_updated", "date_updated", "version"],
+                                     batch_size=batch_size, default_user=user)
+            released["bills"] += len(bills)
+
+
+def activate_paid_vouchers(user: User, bills: QuerySet) -> int:
+    """
+    Moves the AWAITING_PAYMENT vouchers billed on the given paid bills to ASSIGNED, or to UNASSIGNED when they are
+    not assigned to a worker yet. Returns the number of vouchers activated.
+    """
+    voucher_type = ContentType.objects.get_for_model(WorkerVoucher)
+    voucher_ids = list(BillItem.objects.filter(
+        bill__in=bills.filter(status=Bill.Status.PAID), line_type=voucher_type, is_deleted=False
+    ).values_list('line_id', flat=True))
+    if not voucher_ids:
+        return 0
+
+    now = datetime.datetime.now()
+    vouchers = WorkerVoucher.objects.filter(
+        id__in=voucher_ids, is_deleted=False, status=WorkerVoucher.Status.AWAITING_PAYMENT)
+    with transaction.atomic():
+        return update_vouchers_status(
+            vouchers.filter(insuree__isnull=False), WorkerVoucher.Status.ASSIGNED, user, now
+        ) + update_vouchers_status(
+            vouchers.filter(insuree__isnull=True), WorkerVoucher.Status.UNASSIGNED, user, now
+        )
 
 
 def economic_unit_user_filter(user: User, economic_unit_code=None, prefix='') -> Q:
@@ -385,14 +784,11 @@ def economic_unit_user_filter(user: User, economic_unit_code=None, prefix='') ->
         f'{prefix}is_deleted': False
     }
 
-    if not user.is_imis_admin and not user.has_perms(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
+    authorization = get_user_authorization_context(user)
+    if not authorization.can_access_all_economic_units(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
         filters = {
             **filters,
-            f'{prefix}policyholderuser__user': user,
-            f'{prefix}policyholderuser__is_deleted': False,
-            f'{prefix}policyholderuser__user__validity_to__isnull': True,
-            f'{prefix}policyholderuser__user__i_user__validity_to__isnull': True,
-            f'{prefix}is_deleted': False
+            f'{prefix}id__in': authorization.policyholder_ids,
         }
 
     if economic_unit_code:
@@ -409,14 +805,19 @@ def worker_user_filter(user: User, economic_unit_code=None, prefix='') -> Q:
         f'{prefix}validity_to__isnull': True
     }
 
-    if not user.is_imis_admin and not user.has_perms(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
+    authorization = get_user_authorization_context(user)
+    if not authorization.can_access_all_economic_units(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
         filters = {
             **filters,
             f"{prefix}policyholderinsuree__is_deleted": False,
+            f"{prefix}policyholderinsuree__policy_holder_id__in": authorization.policyholder_ids,
         }
-        return Q(**filters) & economic_unit_user_filter(user,
-                                                        economic_unit_code=economic_unit_code,
-                                                        prefix="policyholderinsuree__policy_holder__")
+        if economic_unit_code:
+            filters = {
+                **filters,
+                f"{prefix}policyholderinsuree__policy_holder__code": economic_unit_code,
+            }
+        return Q(**filters)
     else:
         if economic_unit_code:
             filters = {
@@ -428,146 +829,6 @@ def worker_user_filter(user: User, economic_unit_code=None, prefix='') -> Q:
         return Q(**filters)
 
 
-class WorkerUploadService:
-    def __init__(self, user: InteractiveUser):
-        self.user = user
-
-    def upload_worker(self, economic_unit_code, file, upload):
-        error_column = WorkerVoucherConfig.csv_worker_upload_errors_column
-        chf_id_type_column = WorkerVoucherConfig.worker_upload_chf_id_type
-        economic_unit = self._resolve_economic_unit(economic_unit_code)
-        upload.policyholder = economic_unit
-        upload.status = upload.Status.IN_PROGRESS
-        upload.save(username=self.user.login_name)
-        if not file:
-            raise ValueError(_('File is required'))
-        df = self._read_file(file)
-        self._validate_dataframe(df)
-
-        affected_rows = 0
-        skipped_items = 0
-        total_number_of_records_in_file = len(df)
-
-        df[error_column] = (
-            df.apply(lambda row: self._upload_record_with_worker(economic_unit, row), axis=1)
-        )
-
-        for _, row in df.iterrows():
-            if not pd.isna(row[error_column]):
-                skipped_items += 1
-            else:
-                affected_rows += 1
-
-        summary = {
-            'affected_rows': affected_rows,
-            'total_number_of_records_in_file': total_number_of_records_in_file,
-            'skipped_items': skipped_items
-        }
-
-        error_df = df[df[error_column].apply(lambda x: bool(x))]
-        if not error_df.empty:
-            in_memory_file = BytesIO()
-            df.to_csv(in_memory_file, index=False)
-            return (
-                in_memory_file,
-                error_df.set_index(chf_id_type_column)[error_column].to_dict(),
-                summary
-            )
-        return file, None, summary
-
-    def _read_file(self, file):
-        if file.name.endswith('.csv'):
-            return pd.read_csv(file)
-        elif file.name.endswith(('.xls', '.xlsx')):
-            return pd.read_excel(file, engine='openpyxl')
-        else:
-            raise ValueError(_('Unsupported file format. Please upload a CSV or Excel file.'))
-
-    def _validate_dataframe(self, df):
-        if df is None:
-            raise ValueError(_("Unknown error while loading import file"))
-        if df.empty:
-            raise ValueError(_("Import file is empty"))
-        if WorkerVoucherConfig.csv_worker_upload_errors_column in df.columns:
-            raise ValueError(_("Column errors in csv."))
-        if WorkerVoucherConfig.worker_upload_chf_id_type not in df.columns:
-            raise ValueError(_("No national id column in csv file"))
-
-    def _resolve_economic_unit(self, economic_unit_code):
-        if not economic_unit_code:
-            raise ValueError('worker_upload.validation.economic_unit_code_required')
-        economic_unit = PolicyHolder.objects.filter(code=economic_unit_code, is_deleted=False).first()
-        if not economic_unit:
-            raise ValueError('worker_upload.validation.economic_unit_not_found')
-        return economic_unit
-
-    def _upload_record_with_worker(self, economic_unit, row):
-        errors = []
-        user_policyholders = PolicyHolder.objects.filter(
-            economic_unit_user_filter(self.user)).values_list('id', flat=True)
-        chf_id = row[WorkerVoucherConfig.worker_upload_chf_id_type]
-        ph = PolicyHolder.objects.filter(
-            id=economic_unit.id,
-            is_deleted=False,
-        ).first()
-        if not ph:
-            errors.append({"message": _("worker_upload.validation.economic_unit_not_exist")})
-        if ph.id not in user_policyholders:
-            errors.append({
-                "message": _("worker_upload.validation.no_authority_to_use_selected_economic_unit")
-            })
-        data_from_mconnect = self._fetch_data_from_mconnect(chf_id, ph)
-        if data_from_mconnect.get("success", False):
-            errors.append(data_from_mconnect)
-        else:
-            self._add_worker_to_system(chf_id, economic_unit, data_from_mconnect, errors)
-        return errors if errors else None
-
-    def _fetch_data_from_mconnect(self, chf_id, policyholder):
-        data_from_mconnect = {}
-        if WorkerVoucherConfig.validate_created_worker_online:
-            online_result = MConnectWorkerService().fetch_worker_data(chf_id, self.user, policyholder)
-            if not online_result.get("success", False):
-                return online_result
-            else:
-                data_from_mconnect['chf_id'] = chf_id
-                data_from_mconnect['other_names'] = online_result["data"]["GivenName"]
-                data_from_mconnect['last_name'] = online_result["data"]["FamilyName"]
-                data_from_mconnect['dob'] = online_result["data"]["DateOfBirth"]
-                data_from_mconnect['photo'] = {"photo": online_result["data"]["Photo"]}
-        return data_from_mconnect
-
-    def _add_worker_to_system(self, chf_id, economic_unit, data_from_mconnect, errors):
-        phi = PolicyHolderInsuree.objects.filter(
-            insuree__chf_id=chf_id,
-            policy_holder__code=economic_unit.code,
-            is_deleted=False,
-        ).first()
-        if not phi:
-            worker = Insuree.objects.filter(chf_id=chf_id).first()
-            if not worker:
-                data_from_mconnect['audit_user_id'] = self.user.id_for_audit
-                from core.utils import TimeUtils
-                data_from_mconnect['validity_from'] = TimeUtils.now()
-                try:
-                    worker = update_or_create_insuree(data_from_mconnect, self.user)
-                except Exception as e:
-                    errors.append({"success": False, "error": str(e)})
-            if worker:
-                worker = Insuree.objects.filter(chf_id=chf_id).first()
-                policy_holder_insuree_service = PolicyHolderInsureeService(self.user)
-                policy_holder = PolicyHolder.objects.get(code=economic_unit.code, is_deleted=False)
-                policy_holder_insuree = {
-                    'policy_holder_id': f'{policy_holder.id}',
-                    'insuree_id': worker.id,
-                    'contribution_plan_bundle_id': None,
-                }
-                policy_holder_insuree_service.create(policy_holder_insuree)
-        else:
-            errors.append({"message": _("workers.validation.worker_already_assigned_to_unit")})
-        return errors
-
-
 class GroupOfWorkerService(BaseService):
     OBJECT_TYPE = GroupOfWorker
 
@@ -654,11 +915,29 @@ class GroupOfWorkerService(BaseService):
 
 
 def worker_voucher_bill_user_filter(qs: QuerySet, user: User) -> QuerySet:
-    if user.is_imis_admin:
+    authorization = get_user_authorization_context(user)
+    if authorization.is_imis_admin:
         return qs
 
-    user_policyholders = PolicyHolder.objects.filter(
-        economic_unit_user_filter(user)).values_list('id', flat=True)
-
-    return qs.annotate(subject_uuid=Cast('subject_id', UUIDField())) \
-        .filter(subject_uuid__in=user_policyholders)
+    if authorization.can_access_all_economic_units(WorkerVoucherConfig.gql_worker_voucher_search_all_perms):
+        # Bills of (nearly) every economic unit are visible anyway, the cast only excludes deleted ones
+        user_policyholders = PolicyHolder.objects.filter(
+            economic_unit_user_filter(user)).values_list('id', flat=True)
+        return qs.annotate(subject_uuid=Cast('subject_id', UUIDField())) \
+            .filter(subject_uuid__in=user_policyholders)
+
+    # SubjectId is a varchar holding str(policyholder.id), comparing text keeps the column index usable
+    subject_ids = set()
+    for policyholder_id in authorization.policyholder_ids:
+        subject_ids.add(str(policyholder_id))
+        subject_ids.add(str(policyholder_id).upper())
+    return qs.filter(subject_id__in=subject_ids)
+
+
+def __getattr__(name):
+    # WorkerUploadService moved to worker_voucher.worker_upload, it is imported on first access so that
+    # worker_voucher.services keeps exposing it without loading pandas for every process
+    if name == 'WorkerUploadService':
+        from worker_voucher.worker_upload import WorkerUploadService
+        return WorkerUploadService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete
+
+from core.service_signals import ServiceSignalBindType
+from core.signals import bind_service_signal
+from invoice.utils import resolve_payment_details
+from policyholder.models import PolicyHolderUser
+from worker_voucher.authorization import UserAuthorizationContext
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import invalidate_voucher_check_cache, activate_paid_vouchers
+
+logger = logging.getLogger(__name__)
+
+
+def bind_service_signals():
+    bind_service_signal(
+        'worker_voucher_service.update',
+        on_voucher_change,
+        bind_type=ServiceSignalBindType.AFTER
+    )
+    bind_service_signal(
+        'worker_voucher_service.delete',
+        on_voucher_change,
+        bind_type=ServiceSignalBindType.AFTER
+    )
+    bind_service_signal(
+        'worker_voucher_service.bulk_update',
+        on_vouchers_bulk_change,
+        bind_type=ServiceSignalBindType.AFTER
+    )
+    bind_service_signal(
+        'signal_after_invoice_module_payment_received',
+        on_bill_payment_received,
+        bind_type=ServiceSignalBindType.AFTER
+    )
+    # Vouchers saved directly through the model bypass the service signals
+    post_save.connect(on_voucher_save, sender=WorkerVoucher, dispatch_uid="worker_voucher_check_cache")
+    post_save.connect(on_policyholder_user_change, sender=PolicyHolderUser,
+                      dispatch_uid="worker_voucher_user_policyholders_save")
+    post_delete.connect(on_policyholder_user_change, sender=PolicyHolderUser,
+                        dispatch_uid="worker_voucher_user_policyholders_delete")
+
+
+def on_voucher_change(**kwargs):
+    result = kwargs.get('result') or {}
+    if not result.get('success'):
+        return
+    func_args = kwargs.get('data')[0]
+    obj_data = func_args[0] if func_args else {}
+    _invalidate_voucher_check_cache_for_ids([obj_data.get('id')])
+
+
+def on_vouchers_bulk_change(**kwargs):
+    result = kwargs.get('result') or {}
+    if not result.get('success'):
+        return
+    _invalidate_voucher_check_cache_for_ids(result['data']['ids'])
+
+
+def on_bill_payment_received(**kwargs):
+    result = kwargs.get('result') or {}
+    if not result.get('success'):
+        return
+    func_args, func_kwargs = kwargs.get('data')
+    payment_invoice = func_args[0] if func_args else func_kwargs.get('payment_invoice')
+    _invoices, bills = resolve_payment_details(payment_invoice)
+    activate_paid_vouchers(kwargs.get('cls_').user, bills)
+
+
+def on_voucher_save(sender, instance, **kwargs):
+    invalidate_voucher_check_cache([instance.code])
+
+
+def on_policyholder_user_change(sender, instance, **kwargs):
+    UserAuthorizationContext.invalidate(instance.user_id)
+
+
+def _invalidate_voucher_check_cache_for_ids(voucher_ids):
+    codes = WorkerVoucher.objects.filter(id__in=[voucher_id for voucher_id in voucher_ids if voucher_id]) \
+        .values_list('code', flat=True)
+    invalidate_voucher_check_cache(codes)
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Q
+
+from core import datetime
+from core.models import User
+from core.utils import DefaultStorageFileHandler
+from policyholder.models import PolicyHolder
+from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.models import WorkerUpload
+from worker_voucher.services import expire_past_vouchers, release_unpaid_vouchers
+
+logger = logging.getLogger(__name__)
+
+_processing_lock = threading.Lock()
+
+
+def process_worker_uploads():
+    """
+    Processes queued (TRIGGERED) worker uploads until the queue is empty and returns how many were processed.
+    Can be scheduled through SCHEDULER_JOBS as "worker_voucher.tasks.process_worker_uploads".
+    """
+    processed = 0
+    upload = _claim_next_upload()
+    while upload:
+        process_worker_upload(upload)
+        processed += 1
+        upload = _claim_next_upload()
+    return processed
+
+
+def process_worker_upload(upload: WorkerUpload):
+    # Imported here, pandas is only loaded by the processes that handle uploads
+    from worker_voucher.worker_upload import WorkerUploadService
+
+    user = upload.user_created
+    economic_unit_code = (upload.json_ext or {}).get('economic_unit_code')
+    file_path = WorkerVoucherConfig.get_worker_upload_file_path(economic_unit_code, upload.id, upload.file_name)
+    try:
+        # The stored file is streamed, it is never loaded into memory as a whole
+        with default_storage.open(file_path, 'rb') as file:
+            service = WorkerUploadService(user)
+            file_to_upload, errors, summary = service.upload_worker(economic_unit_code, file, upload)
+        if errors:
+            upload.status = WorkerUpload.Status.PARTIAL_SUCCESS
+            upload.error = errors
+        else:
+            upload.status = WorkerUpload.Status.SUCCESS
+        upload.json_ext = {**(upload.json_ext or {}), 'extra_info': summary}
+        upload.save(username=user.login_name)
+        if errors:
+            # The report is kept apart from the uploaded file, which a resumed upload reads again
+            report_handler = DefaultStorageFileHandler(WorkerVoucherConfig.get_worker_upload_report_file_path(
+                economic_unit_code, upload.id, upload.file_name))
+            with file_to_upload:
+                report_handler.save_with_possibility_to_overwrite_file(file_to_upload)
+    except Exception as exc:
+        logger.error("Error while uploading workers", exc_info=exc)
+        upload.error = {'error': str(exc)}
+        upload.policyholder = PolicyHolder.objects.filter(code=economic_unit_code).first()
+        upload.status = WorkerUpload.Status.FAIL
+        # Chunks committed before the failure stay imported, resume_worker_upload continues after them
+        checkpoint = (upload.json_ext or {}).get('checkpoint') or {}
+        summary = {
+            'affected_rows': checkpoint.get('last_committed_row', 0) - checkpoint.get('skipped_items', 0),
+        }
+        upload.json_ext = {**(upload.json_ext or {}), 'extra_info': summary}
+        upload.save(username=user.login_name)
+
+
+def resume_worker_upload(upload: WorkerUpload, username):
+    """
+    Queues a failed or abandoned upload again. It is processed from its checkpoint, using the file stored for it.
+    An IN_PROGRESS upload is abandoned when it had no heartbeat for worker_upload_stale_timeout seconds.
+    """
+    if upload.status == WorkerUpload.Status.IN_PROGRESS:
+        abandoned = WorkerUpload.objects.filter(_abandoned_upload_filter(), id=upload.id).exists()
+        if not abandoned:
+            raise ValueError('worker_upload.validation.upload_in_progress')
+        if not _claim_upload(upload.id, upload.status, upload.json_ext, WorkerUpload.Status.TRIGGERED):
+            raise ValueError('worker_upload.validation.upload_already_resumed')
+        upload.refresh_from_db()
+    elif upload.status != WorkerUpload.Status.FAIL:
+        raise ValueError('worker_upload.validation.only_failed_upload_can_be_resumed')
+    upload.status = WorkerUpload.Status.TRIGGERED
+    upload.error = {}
+    upload.save(username=username)
+
+
+def start_worker_upload_processing():
+    """
+    Processes the upload queue in a daemon thread of the current process, unless that thread is already running.
+    Uploads submitted while the thread is finishing are left to the next upload or to the scheduled job.
+    """
+    if not WorkerVoucherConfig.worker_upload_background_thread:
+        return
+    if not _processing_lock.acquire(blocking=False):
+        return
+    threading.Thread(target=_process_worker_uploads_in_thread, name="worker-upload-queue", daemon=True).start()
+
+
+def _process_worker_uploads_in_thread():
+    try:
+        process_worker_uploads()
+    except Exception as exc:
+        logger.error("Error while processing the worker upload queue", exc_info=exc)
+    finally:
+        connection.close()
+        _processing_lock.release()
+
+
+def _claim_next_upload():
+    candidates = WorkerUpload.objects.filter(_claimable_upload_filter(), is_deleted=False) \
+        .order_by('date_created').values_list('id', 'status', 'json_ext')[:10]
+    for upload_id, status, json_ext in candidates:
+        if _claim_upload(upload_id, status, json_ext):
+            return WorkerUpload.objects.get(id=upload_id)
+    return None
+
+
+def _claimable_upload_filter() -> Q:
+    return Q(status=WorkerUpload.Status.TRIGGERED) | _abandoned_upload_filter()
+
+
+def _abandoned_upload_filter() -> Q:
+    """
+    IN_PROGRESS uploads without a heartbeat for worker_upload_stale_timeout seconds, which were abandoned by
+    a process that stopped while importing them.
+    """
+    stale_timeout = WorkerVoucherConfig.worker_upload_stale_timeout
+    stale = Q(json_ext__heartbeat__lt=time.time() - stale_timeout) | (
+        # Uploads claimed before heartbeats were recorded
+        _without_heartbeat()
+        & Q(date_updated__lt=datetime.datetime.now() - datetime.datetimedelta(seconds=stale_timeout))
+    )
+    return Q(status=WorkerUpload.Status.IN_PROGRESS) & stale
+
+
+def _without_heartbeat() -> Q:
+    return Q(json_ext__isnull=True) | Q(json_ext__heartbeat__isnull=True)
+
+
+def _claim_upload(upload_id, status, json_ext, new_status=WorkerUpload.Status.IN_PROGRESS) -> bool:
+    """
+    Conditional update, an upload polled or resumed by several processes at once is claimed by only one of them.
+    Abandoned uploads are matched on their last heartbeat as well, it changes as soon as one process claims them.
+    """
+    json_ext = json_ext or {}
+    queryset = WorkerUpload.objects.filter(id=upload_id, status=status)
+    if status == WorkerUpload.Status.IN_PROGRESS:
+        heartbeat = json_ext.get('heartbeat')
+        queryset = queryset.filter(json_ext__heartbeat=heartbeat) if heartbeat is not None \
+            else queryset.filter(_without_heartbeat())
+    return bool(queryset.update(status=new_status, json_ext={**json_ext, 'heartbeat': time.time()}))
+
+
+def expire_vouchers(username=None):
+    """
+    Moves UNASSIGNED vouchers, and ASSIGNED vouchers assigned in a past year, past their expiry date to EXPIRED
+    and returns how many were moved. Can be scheduled through SCHEDULER_JOBS as "worker_voucher.tasks.expire_vouchers".
+    """
+    return expire_past_vouchers(get_batch_user(username))
+
+
+def release_overdue_voucher_bills(username=None):
+    """
+    Cancels the voucher bills unpaid after their due date and their AWAITING_PAYMENT vouchers.
+    Returns the number of bills and vouchers canceled.
+    Can be scheduled through SCHEDULER_JOBS as "worker_voucher.tasks.release_overdue_voucher_bills".
+    """
+    return release_unpaid_vouchers(get_batch_user(username))
+
+
+def get_batch_user(username=None) -> User:
+    """
+    User recorded as the author of the changes made by batch jobs, the administrator user unless a username is given.
+    """
+    user = User.objects.filter(username=username).first() if username else User.objects.filter(i_user_id=1).first()
+    if not user:
+        raise ValueError(f"Batch user not found: {username or 'administrator'}")
+    return user
@@ -0,0 +1,47 @@
+from django.test import TestCase
+
+from core import datetime
+from core.models import Role
+from core.test_helpers import create_test_interactive_user
+from worker_voucher.dataloaders import WorkerYearlyVoucherCountLoader, VoucherBillIdLoader
+from worker_voucher.services import create_assigned_vouchers, create_voucher_bill
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, generate_idnp
+
+
+class WorkerVoucherDataLoadersTestCase(TestCase):
+    user = None
+    eu = None
+    worker = None
+    worker2 = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(WorkerVoucherDataLoadersTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='VoucherTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user)
+        cls.worker = create_test_worker_for_eu(cls.user, cls.eu)
+        cls.worker2 = create_test_worker_for_eu(cls.user, cls.eu, chf_id=generate_idnp())
+
+    def test_yearly_voucher_count_load_many(self):
+        year = datetime.date.today().year + 1
+        dates = [datetime.date(year, 1, 1), datetime.date(year, 1, 2)]
+        create_assigned_vouchers(self.user, dates, [self.worker.id], self.eu.id)
+
+        loader = WorkerYearlyVoucherCountLoader(self.user)
+        counts = loader.load_many([(self.worker.id, year), (self.worker2.id, year), (self.worker.id, year + 1)]).get()
+
+        self.assertEquals(counts, [{self.eu.code: 2}, {}, {}])
+
+    def test_bill_id_load_many(self):
+        dates = [datetime.date.today() + datetime.datetimedelta(days=1)]
+        voucher_codes = create_assigned_vouchers(self.user, dates, [self.worker.id, self.worker2.id], self.eu.id)
+        bill = create_voucher_bill(self.user, list(voucher_codes), self.eu.id, voucher_codes=voucher_codes)
+
+        loader = VoucherBillIdLoader()
+        bill_ids = loader.load_many(list(voucher_codes) + [self.eu.id]).get()
+
+        self.assertEquals([str(bill_id) if bill_id else None for bill_id in bill_ids],
+                          [bill['data']['id'], bill['data']['id'], None])
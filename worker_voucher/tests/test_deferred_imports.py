@@ -0,0 +1,42 @@
+import ast
+import os
+
+from django.test import SimpleTestCase
+
+import worker_voucher
+
+
+class DeferredImportsTestCase(SimpleTestCase):
+    """
+    Modules imported by the GraphQL schema must not import pandas or the MConnect client at module level,
+    these are only needed by worker uploads and MConnect calls and are imported where they are used.
+    """
+    MODULES = ('services.py', 'schema.py', 'gql_queries.py', 'gql_mutations.py', 'models.py', 'dataloaders.py',
+               'authorization.py', 'validation.py', 'mconnect.py', 'tasks.py', 'signals.py', 'views.py', 'urls.py')
+    DEFERRED_MODULES = ('pandas', 'msystems.services.mconnect_worker_service')
+
+    def test_no_module_level_deferred_imports(self):
+        package_dir = os.path.dirname(worker_voucher.__file__)
+        for file_name in self.MODULES:
+            path = os.path.join(package_dir, file_name)
+            with open(path) as source:
+                tree = ast.parse(source.read(), filename=path)
+            for imported in _get_module_level_imports(tree):
+                with self.subTest(module=file_name, imported=imported):
+                    self.assertFalse(any(imported == module or imported.startswith(f'{module}.')
+                                         for module in self.DEFERRED_MODULES))
+
+    def test_worker_upload_service_reexported(self):
+        from worker_voucher.services import WorkerUploadService
+        from worker_voucher.worker_upload import WorkerUploadService as MovedWorkerUploadService
+
+        self.assertIs(WorkerUploadService, MovedWorkerUploadService)
+
+
+def _get_module_level_imports(tree):
+    # Only statements at module level, imports inside functions are deferred to the first call
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            yield node.module
@@ -0,0 +1,42 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.test_helpers import create_test_interactive_user
+from policyholder.models import PolicyHolder, PolicyHolderInsuree, PolicyHolderUser
+from worker_voucher.models import WorkerVoucher, WorkerGroup
+
+
+class GenerateVoucherDataTestCase(TestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(GenerateVoucherDataTestCase, cls).setUpClass()
+        cls.user = create_test_interactive_user(username='GenerateVoucherDataUser1')
+
+    def test_generate_voucher_data(self):
+        call_command('generatevoucherdata', policyholders=2, users_per_policyholder=2, workers_per_policyholder=3,
+                     groups_per_policyholder=1, vouchers_per_worker=4, unassigned_per_policyholder=5, years=2,
+                     batch_size=4, prefix='TESTGEN', username=self.user.username, stdout=StringIO())
+
+        policyholders = PolicyHolder.objects.filter(code__startswith='TESTGEN')
+        self.assertEquals(policyholders.count(), 2)
+        self.assertEquals(PolicyHolderUser.objects.filter(policy_holder__in=policyholders).count(), 4)
+        self.assertEquals(PolicyHolderInsuree.objects.filter(policy_holder__in=policyholders).count(), 6)
+        self.assertEquals(WorkerGroup.objects.filter(group__policyholder__in=policyholders).count(), 6)
+        vouchers = WorkerVoucher.objects.filter(policyholder__in=policyholders)
+        self.assertEquals(vouchers.filter(insuree__isnull=False).count(), 6 * 4 * 2)
+        self.assertEquals(vouchers.filter(status=WorkerVoucher.Status.UNASSIGNED, insuree__isnull=True).count(), 10)
+
+    def test_generate_voucher_data_with_another_prefix(self):
+        options = {'policyholders': 1, 'workers_per_policyholder': 2, 'vouchers_per_worker': 1, 'years': 1,
+                   'username': self.user.username, 'stdout': StringIO()}
+        call_command('generatevoucherdata', prefix='TESTGENA', **options)
+        call_command('generatevoucherdata', prefix='TESTGENB', **options)
+
+        self.assertEquals(PolicyHolder.objects.filter(code__startswith='TESTGEN').count(), 2)
+        chf_ids = PolicyHolderInsuree.objects.filter(policy_holder__code__startswith='TESTGEN') \
+            .values_list('insuree__chf_id', flat=True)
+        self.assertEquals(len(set(chf_ids)), 4)
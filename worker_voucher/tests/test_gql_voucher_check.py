@@ -8,6 +8,7 @@ from core.models import Role
 from core.test_helpers import create_test_interactive_user
 from worker_voucher.models import WorkerVoucher
 from worker_voucher.schema import Query, Mutation
+from worker_voucher.services import WorkerVoucherService
 from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu
 from worker_voucher.tests.data.gql_payloads import gql_query_voucher_check
 
@@ -99,6 +100,22 @@ class GQLVoucherCheckTestCase(TestCase):
         self.assertEqual(query_data['employerCode'], voucher.policyholder.code)
         self.assertEqual(query_data['employerName'], voucher.policyholder.trade_name)
 
+    def test_get_voucher_by_code_after_cancel(self):
+        voucher = self._create_test_voucher()
+        payload = gql_query_voucher_check % (
+            voucher.code
+        )
+        query_result = self.gql_client.execute(payload, context=self.gql_context)
+        self.assertEqual(query_result['data']['voucherCheck']['isExisted'], True)
+
+        result = WorkerVoucherService(self.user).update({"id": voucher.id, "status": WorkerVoucher.Status.CANCELED})
+        self.assertTrue(result['success'], result)
+
+        query_result = self.gql_client.execute(payload, context=self.gql_context)
+        query_data = query_result['data']['voucherCheck']
+        self.assertEqual(query_data['isExisted'], False)
+        self.assertEqual(query_data['isValid'], False)
+
     def _create_test_voucher(self, code="001", status=WorkerVoucher.Status.ASSIGNED, assigned_date=None,
                              expiry_date=None):
         voucher = WorkerVoucher(
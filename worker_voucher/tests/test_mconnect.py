@@ -0,0 +1,98 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.mconnect import fetch_workers_online_data, fetch_worker_online_data, \
+    get_worker_data_cache_stats
+from worker_voucher.tests.util import OverrideAppConfig
+
+
+class StubMConnectWorkerService:
+    calls = []
+    lock = threading.Lock()
+
+    def fetch_worker_data(self, chf_id, user, policyholder):
+        with self.lock:
+            self.calls.append(chf_id)
+        if chf_id == "slow":
+            time.sleep(1)
+        if chf_id == "missing":
+            return {"success": False, "error": "Worker not found"}
+        return {"success": True, "data": {"GivenName": "Test", "FamilyName": chf_id}}
+
+
+class MConnectWorkerDataTestCase(SimpleTestCase):
+    def setUp(self):
+        StubMConnectWorkerService.calls = []
+        cache.clear()
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_concurrency": 4, "mconnect_timeout": 5,
+                                             "mconnect_rate_limit": 0})
+    def test_fetch_unique_chf_ids(self):
+        chf_ids = [str(i) for i in range(20)]
+        results = fetch_workers_online_data(chf_ids + chf_ids + ["missing"], None, None,
+                                            service_class=StubMConnectWorkerService)
+
+        self.assertEquals(sorted(StubMConnectWorkerService.calls), sorted(chf_ids + ["missing"]))
+        self.assertEquals(results["7"]["data"]["FamilyName"], "7")
+        self.assertFalse(results["missing"]["success"])
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_concurrency": 2, "mconnect_timeout": 0.2,
+                                             "mconnect_rate_limit": 0})
+    def test_fetch_timeout(self):
+        results = fetch_workers_online_data(["slow", "1"], None, None, service_class=StubMConnectWorkerService)
+
+        self.assertFalse(results["slow"]["success"])
+        self.assertTrue(results["1"]["success"])
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_concurrency": 4, "mconnect_timeout": 5,
+                                             "mconnect_rate_limit": 20})
+    def test_fetch_rate_limit(self):
+        started = time.monotonic()
+        fetch_workers_online_data([str(i) for i in range(5)], None, None, service_class=StubMConnectWorkerService)
+
+        # 5 calls at 20 per second start over at least 4 intervals of 50ms
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_cache_ttl": 60})
+    def test_cache(self):
+        fetch_worker_online_data("1", None, None, service_class=StubMConnectWorkerService)
+        result = fetch_worker_online_data("1", None, None, service_class=StubMConnectWorkerService)
+        fetch_worker_online_data("missing", None, None, service_class=StubMConnectWorkerService)
+        fetch_worker_online_data("missing", None, None, service_class=StubMConnectWorkerService)
+
+        self.assertEquals(result["data"]["FamilyName"], "1")
+        self.assertEquals(StubMConnectWorkerService.calls, ["1", "missing", "missing"])
+        self.assertEquals(get_worker_data_cache_stats(), {"hits": 1, "misses": 3})
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_cache_ttl": 60})
+    def test_cache_by_economic_unit(self):
+        eu, eu2 = SimpleNamespace(id=1), SimpleNamespace(id=2)
+        fetch_worker_online_data("1", None, eu, service_class=StubMConnectWorkerService)
+        fetch_worker_online_data("1", None, eu2, service_class=StubMConnectWorkerService)
+        fetch_worker_online_data("1", None, eu, service_class=StubMConnectWorkerService)
+
+        # Data fetched for one economic unit is not served to another one
+        self.assertEquals(StubMConnectWorkerService.calls, ["1", "1"])
+        self.assertEquals(get_worker_data_cache_stats(), {"hits": 1, "misses": 2})
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_cache_ttl": 60, "mconnect_concurrency": 4,
+                                             "mconnect_timeout": 5, "mconnect_rate_limit": 0})
+    def test_cache_shared_with_batch(self):
+        fetch_worker_online_data("1", None, None, service_class=StubMConnectWorkerService)
+        results = fetch_workers_online_data(["1", "2"], None, None, service_class=StubMConnectWorkerService)
+
+        self.assertEquals(StubMConnectWorkerService.calls, ["1", "2"])
+        self.assertEquals(results["1"], {"success": True, "data": {"GivenName": "Test", "FamilyName": "1",
+                                                                   "DateOfBirth": None, "Photo": None}})
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"mconnect_cache_ttl": 0})
+    def test_cache_disabled(self):
+        fetch_worker_online_data("1", None, None, service_class=StubMConnectWorkerService)
+        fetch_worker_online_data("1", None, None, service_class=StubMConnectWorkerService)
+
+        self.assertEquals(StubMConnectWorkerService.calls, ["1", "1"])
@@ -4,8 +4,11 @@ from core import datetime
 from core.models import Role
 from core.test_helpers import create_test_interactive_user
 from worker_voucher.apps import WorkerVoucherConfig
-from worker_voucher.services import validate_acquire_assigned_vouchers, create_assigned_voucher
-from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, OverrideAppConfig
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import validate_acquire_assigned_vouchers, create_assigned_voucher, \
+    create_assigned_vouchers
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, OverrideAppConfig, \
+    generate_idnp
 
 
 class ValidateAcquireAssignedTestCase(TestCase):
@@ -56,6 +59,19 @@ class ValidateAcquireAssignedTestCase(TestCase):
 
         self.assertFalse(res['success'])
 
+    def test_validate_duplicate_worker(self):
+        payload = (
+            self.user,
+            self.eu.code,
+            (self.worker.chf_id, self.worker.chf_id),
+            ({'start_date': self.today, 'end_date': self.today},)
+        )
+
+        res = validate_acquire_assigned_vouchers(*payload)
+
+        self.assertFalse(res['success'])
+        self.assertEquals(res['error'], f"Duplicate worker: {self.worker.chf_id}")
+
     def test_validate_ph_not_exists(self):
         payload = (
             self.user,
@@ -68,6 +84,38 @@ class ValidateAcquireAssignedTestCase(TestCase):
 
         self.assertFalse(res['success'])
 
+    @OverrideAppConfig(WorkerVoucherConfig, {"voucher_expiry_type": "fixed_period",
+                                           "voucher_expiry_period": {"years": 1}})
+    def test_validate_multiple_date_ranges(self):
+        payload = (
+            self.user,
+            self.eu.code,
+            (self.worker.chf_id,),
+            ({'start_date': self.today + datetime.datetimedelta(days=10),
+              'end_date': self.today + datetime.datetimedelta(days=12)},
+             {'start_date': self.today, 'end_date': self.tomorrow},)
+        )
+
+        res = validate_acquire_assigned_vouchers(*payload)
+
+        self.assertTrue(res['success'], res.get('error'))
+        self.assertEquals(res['data']['count'], 5)
+        self.assertEquals(list(res['data']['dates'])[0], self.today)
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"voucher_expiry_type": "fixed_period",
+                                           "voucher_expiry_period": {"days": 5}})
+    def test_validate_dates_after_expiry(self):
+        payload = (
+            self.user,
+            self.eu.code,
+            (self.worker.chf_id,),
+            ({'start_date': self.today, 'end_date': self.today + datetime.datetimedelta(days=10)},)
+        )
+
+        res = validate_acquire_assigned_vouchers(*payload)
+
+        self.assertFalse(res['success'])
+
     def test_validate_dates_overlap(self):
         payload = (
             self.user,
@@ -138,6 +186,31 @@ class ValidateAcquireAssignedTestCase(TestCase):
 
         self.assertTrue(res['success'])
 
+    @OverrideAppConfig(WorkerVoucherConfig, {"yearly_worker_voucher_limit": 3,
+                                           "voucher_expiry_type": "fixed_period",
+                                           "voucher_expiry_period": {"years": 2}})
+    def test_validate_worker_voucher_limit_reached_all_workers_reported(self):
+        voucher_limit = WorkerVoucherConfig.yearly_worker_voucher_limit
+        date_start = datetime.date(datetime.date.today().year + 1, 1, 1)
+        worker2 = create_test_worker_for_eu(self.user, self.eu, chf_id=generate_idnp())
+        dates = [date_start + datetime.datetimedelta(days=i) for i in range(voucher_limit)]
+        create_assigned_vouchers(self.user, dates, [self.worker.id, worker2.id], self.eu.id)
+
+        date_test = date_start + datetime.datetimedelta(days=voucher_limit)
+
+        payload = (
+            self.user,
+            self.eu.code,
+            (self.worker.chf_id, worker2.chf_id),
+            ([{'start_date': date_test, 'end_date': date_test}])
+        )
+
+        res = validate_acquire_assigned_vouchers(*payload)
+
+        self.assertFalse(res['success'])
+        self.assertIn(self.worker.chf_id, res['error'])
+        self.assertIn(worker2.chf_id, res['error'])
+
     def test_validate_start_date_in_the_past(self):
         payload = (
             self.user,
@@ -162,6 +235,19 @@ class ValidateAcquireAssignedTestCase(TestCase):
 
         self.assertFalse(res['success'])
 
+    def test_create_assigned_vouchers_bulk(self):
+        dates = [self.tomorrow + datetime.datetimedelta(days=i) for i in range(3)]
+
+        voucher_codes = create_assigned_vouchers(self.user, dates, [self.worker.id], self.eu.id)
+        voucher_ids = list(voucher_codes)
+
+        self.assertEquals(len(voucher_ids), 3)
+        vouchers = WorkerVoucher.objects.filter(id__in=voucher_ids, insuree=self.worker, policyholder=self.eu,
+                                                status=WorkerVoucher.Status.AWAITING_PAYMENT)
+        self.assertEquals(vouchers.count(), 3)
+        self.assertEquals({str(voucher.id): voucher.code for voucher in vouchers}, voucher_codes)
+        self.assertEquals(WorkerVoucher.history.filter(id__in=voucher_ids).count(), 3)
+
     def _acquire_vouchers(self, date_start, amount):
         dates = [date_start + datetime.datetimedelta(days=i) for i in range(amount)]
 
@@ -5,7 +5,7 @@ from core.models import Role
 from core import datetime
 from core.test_helpers import create_test_interactive_user
 from worker_voucher.models import WorkerVoucher
-from worker_voucher.services import validate_assign_vouchers
+from worker_voucher.services import validate_assign_vouchers, assign_vouchers
 from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu
 
 
@@ -59,3 +59,18 @@ class ValidateAssignVouchersTestCase(TestCase):
 
         res = validate_assign_vouchers(*payload)
         self.assertFalse(res['success'])
+
+    def test_assign_vouchers_bulk(self):
+        res = validate_assign_vouchers(self.user, self.eu.code, (self.worker.chf_id,),
+                                       ({'start_date': self.today, 'end_date': self.today},))
+        self.assertTrue(res['success'], res.get('error'))
+
+        voucher_ids = assign_vouchers(self.user, [self.worker.id], res['data']['dates'],
+                                      res['data']['unassigned_vouchers'])
+
+        self.assertEquals(voucher_ids, [str(self.unassigned_voucher.id)])
+        voucher = WorkerVoucher.objects.get(id=self.unassigned_voucher.id)
+        self.assertEquals(voucher.status, WorkerVoucher.Status.ASSIGNED)
+        self.assertEquals(voucher.insuree_id, self.worker.id)
+        self.assertEquals(voucher.assigned_date.date(), self.today)
+        self.assertTrue(WorkerVoucher.history.filter(id=voucher.id, status=WorkerVoucher.Status.ASSIGNED).exists())
@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from core import datetime
+from core.models import Role
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.test_helpers import create_test_interactive_user
+from worker_voucher.services import create_assigned_vouchers
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, generate_idnp
+
+
+class VoucherBulkCreateTestCase(TestCase):
+    user = None
+    eu = None
+    worker = None
+    worker2 = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(VoucherBulkCreateTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='VoucherBulkCreateTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user, code='test_bulk_create_eu')
+        cls.worker = create_test_worker_for_eu(cls.user, cls.eu)
+        cls.worker2 = create_test_worker_for_eu(cls.user, cls.eu, chf_id=generate_idnp())
+
+    def test_create_hooks_fire_for_bulk_created_vouchers(self):
+        calls = []
+
+        def on_voucher_create(**kwargs):
+            obj_data = kwargs['data'][0][0]
+            calls.append((obj_data['insuree_id'], kwargs['result']['success'], kwargs['result']['data']['code']))
+
+        create_signal = REGISTERED_SERVICE_SIGNALS['worker_voucher_service.create']
+        create_signal.after_service_signal.connect(on_voucher_create)
+        try:
+            dates = [datetime.date.today() + datetime.datetimedelta(days=1)]
+            voucher_codes = create_assigned_vouchers(self.user, dates, [self.worker.id, self.worker2.id], self.eu.id)
+        finally:
+            create_signal.after_service_signal.disconnect(on_voucher_create)
+
+        codes = list(voucher_codes.values())
+        self.assertEquals(calls, [(self.worker.id, True, codes[0]), (self.worker2.id, True, codes[1])])
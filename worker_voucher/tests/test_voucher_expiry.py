@@ -0,0 +1,84 @@
+from django.test import TestCase
+
+from core import datetime
+from core.models import Role
+from core.test_helpers import create_test_interactive_user
+from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import expire_past_vouchers, get_worker_yearly_voucher_count_counts, \
+    validate_acquire_assigned_vouchers
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, OverrideAppConfig
+
+
+class VoucherExpiryTestCase(TestCase):
+    user = None
+    eu = None
+    worker = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(VoucherExpiryTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='VoucherExpiryTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user, code='test_expiry_eu')
+        cls.worker = create_test_worker_for_eu(cls.user, cls.eu)
+
+        cls.yesterday = datetime.datetime.now() - datetime.datetimedelta(days=1)
+        cls.tomorrow = datetime.datetime.now() + datetime.datetimedelta(days=1)
+        cls.last_year = datetime.datetime.now() - datetime.datetimedelta(years=1)
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"voucher_bulk_batch_size": 1})
+    def test_expire_past_vouchers(self):
+        assigned = self._create_test_voucher("exp001", WorkerVoucher.Status.ASSIGNED, self.yesterday,
+                                             assigned_date=self.last_year)
+        unassigned = self._create_test_voucher("exp002", WorkerVoucher.Status.UNASSIGNED, self.yesterday,
+                                               insuree=False)
+        valid = self._create_test_voucher("exp003", WorkerVoucher.Status.ASSIGNED, self.tomorrow)
+        awaiting_payment = self._create_test_voucher("exp004", WorkerVoucher.Status.AWAITING_PAYMENT, self.yesterday)
+        assigned_this_year = self._create_test_voucher("exp005", WorkerVoucher.Status.ASSIGNED, self.yesterday,
+                                                       assigned_date=datetime.datetime(datetime.date.today().year, 1, 1))
+
+        expired = expire_past_vouchers(self.user)
+
+        self.assertEquals(expired, 2)
+        for voucher, status in [(assigned, WorkerVoucher.Status.EXPIRED),
+                                (unassigned, WorkerVoucher.Status.EXPIRED),
+                                (valid, WorkerVoucher.Status.ASSIGNED),
+                                (awaiting_payment, WorkerVoucher.Status.AWAITING_PAYMENT),
+                                (assigned_this_year, WorkerVoucher.Status.ASSIGNED)]:
+            voucher.refresh_from_db()
+            self.assertEquals(voucher.status, status)
+        self.assertEquals(assigned.version, 2)
+        self.assertEquals(assigned.history.first().status, WorkerVoucher.Status.EXPIRED)
+        self.assertEquals(expire_past_vouchers(self.user), 0)
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"yearly_worker_voucher_limit": 1})
+    def test_expired_vouchers_count_toward_yearly_limit(self):
+        today = datetime.date.today()
+        voucher = self._create_test_voucher("exp006", WorkerVoucher.Status.ASSIGNED, self.yesterday,
+                                            assigned_date=datetime.datetime(today.year, today.month, today.day))
+
+        expire_past_vouchers(self.user)
+
+        voucher.refresh_from_db()
+        self.assertEquals(voucher.status, WorkerVoucher.Status.ASSIGNED)
+        counts = get_worker_yearly_voucher_count_counts(self.worker, self.user, today.year)
+        self.assertEquals(counts, {self.eu.code: 1})
+        res = validate_acquire_assigned_vouchers(
+            self.user, self.eu.code, (self.worker.chf_id,),
+            ({'start_date': today, 'end_date': today},))
+        self.assertFalse(res['success'])
+
+    def _create_test_voucher(self, code, status, expiry_date, insuree=True, assigned_date=None):
+        voucher = WorkerVoucher(
+            insuree=self.worker if insuree else None,
+            policyholder=self.eu,
+            code=code,
+            status=status,
+            assigned_date=(assigned_date or self.yesterday) if insuree else None,
+            expiry_date=expiry_date,
+        )
+        voucher.save(username=self.user.username)
+        return voucher
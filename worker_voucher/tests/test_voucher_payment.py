@@ -0,0 +1,68 @@
+from django.test import TestCase
+
+from core import datetime
+from core.models import Role
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.test_helpers import create_test_interactive_user
+from invoice.models import Bill, BillItem
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import create_assigned_vouchers, create_unassigned_voucher, create_voucher_bill, \
+    activate_paid_vouchers
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu
+
+
+class VoucherPaymentTestCase(TestCase):
+    user = None
+    eu = None
+    worker = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(VoucherPaymentTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='VoucherPaymentTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user, code='test_payment_eu')
+        cls.worker = create_test_worker_for_eu(cls.user, cls.eu)
+
+    def test_create_voucher_bill(self):
+        calls = []
+
+        def on_bill_create(**kwargs):
+            calls.append(kwargs['result']['data']['id'])
+
+        dates = [datetime.date.today() + datetime.datetimedelta(days=1),
+                 datetime.date.today() + datetime.datetimedelta(days=2)]
+        voucher_codes = create_assigned_vouchers(self.user, dates, [self.worker.id], self.eu.id)
+        bill_create_signal = REGISTERED_SERVICE_SIGNALS['signal_after_invoice_module_bill_create_service']
+        bill_create_signal.after_service_signal.connect(on_bill_create)
+        try:
+            bill_id = create_voucher_bill(self.user, list(voucher_codes), self.eu.id,
+                                          voucher_codes=voucher_codes)['data']['id']
+        finally:
+            bill_create_signal.after_service_signal.disconnect(on_bill_create)
+
+        bill = Bill.objects.get(id=bill_id)
+        items = BillItem.objects.filter(bill=bill)
+        self.assertEquals(calls, [bill_id])
+        self.assertEquals(sorted(items.values_list('line_id', flat=True)), sorted(str(id) for id in voucher_codes))
+        self.assertEquals(bill.amount_total, sum(item.amount_total for item in items))
+
+    def test_activate_paid_vouchers(self):
+        dates = [datetime.date.today() + datetime.datetimedelta(days=1)]
+        assigned_ids = list(create_assigned_vouchers(self.user, dates, [self.worker.id], self.eu.id))
+        unassigned_id = create_unassigned_voucher(self.user, self.eu.id)
+        bill_id = create_voucher_bill(self.user, assigned_ids + [unassigned_id], self.eu.id)['data']['id']
+        bills = Bill.objects.filter(id=bill_id)
+
+        self.assertEquals(activate_paid_vouchers(self.user, bills), 0)
+
+        bill = bills.get()
+        bill.status = Bill.Status.PAID
+        bill.save(user=self.user)
+
+        self.assertEquals(activate_paid_vouchers(self.user, bills), 2)
+        self.assertEquals(WorkerVoucher.objects.get(id=assigned_ids[0]).status, WorkerVoucher.Status.ASSIGNED)
+        self.assertEquals(WorkerVoucher.objects.get(id=unassigned_id).status, WorkerVoucher.Status.UNASSIGNED)
+        self.assertEquals(activate_paid_vouchers(self.user, bills), 0)
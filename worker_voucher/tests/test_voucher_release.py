@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from core import datetime
+from core.models import Role
+from core.test_helpers import create_test_interactive_user
+from invoice.models import Bill
+from worker_voucher.models import WorkerVoucher
+from worker_voucher.services import create_assigned_vouchers, create_voucher_bill, release_unpaid_vouchers
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu
+
+
+class VoucherReleaseTestCase(TestCase):
+    user = None
+    eu = None
+    worker = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(VoucherReleaseTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='VoucherReleaseTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user, code='test_release_eu')
+        cls.worker = create_test_worker_for_eu(cls.user, cls.eu)
+
+    def test_release_unpaid_vouchers(self):
+        dates = [datetime.date.today() + datetime.datetimedelta(days=1),
+                 datetime.date.today() + datetime.datetimedelta(days=2)]
+        voucher_codes = create_assigned_vouchers(self.user, dates, [self.worker.id], self.eu.id)
+        bill = create_voucher_bill(self.user, list(voucher_codes), self.eu.id, voucher_codes=voucher_codes)
+
+        self.assertEquals(release_unpaid_vouchers(self.user), {"bills": 0, "vouchers": 0})
+
+        released = release_unpaid_vouchers(self.user, today=datetime.date.today() + datetime.datetimedelta(days=365))
+
+        self.assertEquals(released, {"bills": 1, "vouchers": 2})
+        self.assertEquals(Bill.objects.get(id=bill['data']['id']).status, Bill.Status.CANCELLED)
+        self.assertEquals(
+            set(WorkerVoucher.objects.filter(id__in=list(voucher_codes)).values_list('status', flat=True)),
+            {WorkerVoucher.Status.CANCELED})
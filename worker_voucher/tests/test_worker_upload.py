@@ -0,0 +1,222 @@
+import time
+from io import BytesIO
+
+import pandas as pd
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from core.models import Role
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.test_helpers import create_test_interactive_user
+from policyholder.models import PolicyHolderInsuree
+from openpyxl import Workbook
+from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.models import WorkerUpload, WorkerUploadRowError
+from worker_voucher.tasks import _claim_next_upload, resume_worker_upload, process_worker_upload
+from worker_voucher.worker_upload import WorkerUploadService
+from worker_voucher.tests.util import create_test_eu_for_user, create_test_worker_for_eu, create_test_worker, \
+    create_test_eu, generate_idnp, OverrideAppConfig
+
+
+class WorkerUploadTestCase(TestCase):
+    user = None
+    eu = None
+    member = None
+    worker = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(WorkerUploadTestCase, cls).setUpClass()
+
+        role_employer = Role.objects.get(name='Employer', validity_to__isnull=True)
+
+        cls.user = create_test_interactive_user(username='WorkerUploadTestUser1', roles=[role_employer.id])
+        cls.eu = create_test_eu_for_user(cls.user, code='test_upload_eu')
+        cls.eu2 = create_test_eu(cls.user, code='test_upload_eu2')
+        cls.member = create_test_worker_for_eu(cls.user, cls.eu, chf_id=generate_idnp())
+        cls.worker = create_test_worker(cls.user, chf_id=generate_idnp())
+        cls.worker2 = create_test_worker(cls.user, chf_id=generate_idnp())
+
+    def _upload(self, economic_unit_code, chf_ids, upload=None):
+        content = "\n".join(["national_id", *chf_ids]).encode()
+        upload = upload or WorkerUpload()
+        upload.save(username=self.user.username)
+        return WorkerUploadService(self.user).upload_worker(
+            economic_unit_code, SimpleUploadedFile("workers.csv", content), upload)
+
+    def test_upload_existing_workers(self):
+        _file, errors, summary = self._upload(
+            self.eu.code, [self.worker.chf_id, self.member.chf_id, self.worker.chf_id])
+
+        self.assertEquals(summary, {
+            'affected_rows': 1,
+            'total_number_of_records_in_file': 3,
+            'skipped_items': 2,
+        })
+        self.assertEquals([str(chf_id) for chf_id in errors], [self.member.chf_id, self.worker.chf_id])
+        self.assertEquals(PolicyHolderInsuree.objects.filter(
+            policy_holder=self.eu, insuree=self.worker, is_deleted=False).count(), 1)
+
+    def test_upload_unauthorized_economic_unit(self):
+        _file, errors, summary = self._upload(self.eu2.code, [self.worker.chf_id])
+
+        self.assertEquals(summary['skipped_items'], 1)
+        self.assertFalse(PolicyHolderInsuree.objects.filter(policy_holder=self.eu2).exists())
+
+    def test_upload_progress(self):
+        upload = WorkerUpload()
+        self._upload(self.eu.code, [self.worker.chf_id, self.member.chf_id], upload=upload)
+
+        upload.refresh_from_db()
+        self.assertEquals(upload.json_ext['progress']['rows_processed'], 2)
+        self.assertEquals(upload.json_ext['progress']['total_rows'], 2)
+        self.assertEquals(upload.json_ext['progress']['eta_seconds'], 0)
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"worker_upload_batch_size": 1, "worker_upload_commit_batch_size": 1})
+    def test_upload_excel_in_chunks(self):
+        workbook = Workbook()
+        workbook.active.append(["national_id"])
+        for chf_id in [self.worker.chf_id, self.member.chf_id, self.worker.chf_id]:
+            workbook.active.append([chf_id])
+        content = BytesIO()
+        workbook.save(content)
+        upload = WorkerUpload()
+        upload.save(username=self.user.username)
+
+        report, errors, summary = WorkerUploadService(self.user).upload_worker(
+            self.eu.code, SimpleUploadedFile("workers.xlsx", content.getvalue()), upload)
+
+        self.assertEquals(summary['affected_rows'], 1)
+        self.assertEquals(summary['skipped_items'], 2)
+        report_lines = report.read().decode().splitlines()
+        self.assertEquals(len(report_lines), 4)
+        self.assertEquals(report_lines[0], "national_id,errors")
+
+    def test_upload_resume_from_checkpoint(self):
+        upload = WorkerUpload(json_ext={'checkpoint': {'last_committed_row': 1, 'skipped_items': 1}})
+        upload.save(username=self.user.username)
+        WorkerUploadRowError.objects.create(
+            upload=upload, row=0, errors=[{"message": "workers.validation.worker_already_assigned_to_unit"}])
+        _file, errors, summary = self._upload(self.eu.code, [self.worker2.chf_id, self.worker.chf_id], upload=upload)
+
+        self.assertEquals(summary, {
+            'affected_rows': 1,
+            'total_number_of_records_in_file': 2,
+            'skipped_items': 1,
+        })
+        self.assertEquals(list(errors), [self.worker2.chf_id])
+        self.assertTrue(PolicyHolderInsuree.objects.filter(policy_holder=self.eu, insuree=self.worker).exists())
+        self.assertFalse(PolicyHolderInsuree.objects.filter(policy_holder=self.eu, insuree=self.worker2).exists())
+        upload.refresh_from_db()
+        self.assertEquals(upload.json_ext['checkpoint']['last_committed_row'], 2)
+        self.assertEquals(upload.json_ext['checkpoint'], {'last_committed_row': 2, 'skipped_items': 1})
+
+    @OverrideAppConfig(WorkerVoucherConfig, {"validate_created_worker_online": False})
+    def test_upload_new_worker_sends_insuree_signal(self):
+        chf_id = generate_idnp()
+        calls = []
+
+        def on_insuree_create_or_update(**kwargs):
+            calls.append((kwargs['data'][0][0]['chf_id'], kwargs['result'].chf_id, kwargs['result'].id))
+
+        signal = REGISTERED_SERVICE_SIGNALS['insuree_service.create_or_update']
+        signal.after_service_signal.connect(on_insuree_create_or_update)
+        try:
+            _file, _errors, summary = self._upload(self.eu.code, [chf_id])
+        finally:
+            signal.after_service_signal.disconnect(on_insuree_create_or_update)
+
+        self.assertEquals(summary['affected_rows'], 1)
+        insuree_id = PolicyHolderInsuree.objects.get(policy_holder=self.eu, insuree__chf_id=chf_id).insuree_id
+        self.assertEquals(calls, [(chf_id, chf_id, insuree_id)])
+
+    def test_queued_uploads_of_the_same_file_name(self):
+        uploads = []
+        for chf_id in [self.worker.chf_id, self.member.chf_id]:
+            upload = WorkerUpload(file_name="workers.csv", json_ext={'economic_unit_code': self.eu.code})
+            upload.save(username=self.user.username)
+            file_path = WorkerVoucherConfig.get_worker_upload_file_path(self.eu.code, upload.id, upload.file_name)
+            default_storage.save(file_path, SimpleUploadedFile("workers.csv", f"national_id\n{chf_id}".encode()))
+            self.addCleanup(default_storage.delete, file_path)
+            uploads.append(upload)
+
+        process_worker_upload(uploads[0])
+        process_worker_upload(uploads[1])
+
+        self.assertEquals(uploads[0].status, WorkerUpload.Status.SUCCESS)
+        self.assertEquals(uploads[1].status, WorkerUpload.Status.PARTIAL_SUCCESS)
+        report_path = WorkerVoucherConfig.get_worker_upload_report_file_path(
+            self.eu.code, uploads[1].id, uploads[1].file_name)
+        self.addCleanup(default_storage.delete, report_path)
+        self.assertTrue(default_storage.exists(report_path))
+
+    def test_validate_upload(self):
+        content = "\n".join(["national_id", self.worker.chf_id, self.member.chf_id, self.worker.chf_id]).encode()
+
+        report, errors, summary = WorkerUploadService(self.user).validate_upload(
+            self.eu.code, SimpleUploadedFile("workers.csv", content))
+
+        self.assertEquals(summary, {
+            'affected_rows': 1,
+            'total_number_of_records_in_file': 3,
+            'skipped_items': 2,
+        })
+        self.assertEquals(list(errors), [self.member.chf_id, self.worker.chf_id])
+        self.assertFalse(PolicyHolderInsuree.objects.filter(policy_holder=self.eu, insuree=self.worker).exists())
+
+    def test_classify_rows(self):
+        service = WorkerUploadService(self.user)
+        seen_chf_ids = {self.worker2.chf_id}
+        chf_ids = service._normalize_chf_ids(pd.Series(
+            [self.worker.chf_id, self.member.chf_id, self.worker.chf_id, None, self.worker2.chf_id, "0000000000000"]))
+
+        row_classes, insuree_ids = service._classify_rows(self.eu, chf_ids, seen_chf_ids)
+
+        self.assertEquals(list(row_classes), [
+            WorkerUploadService.ROW_EXISTING_INSUREE,
+            WorkerUploadService.ROW_ALREADY_MEMBER,
+            WorkerUploadService.ROW_DUPLICATE,
+            WorkerUploadService.ROW_MISSING_NATIONAL_ID,
+            WorkerUploadService.ROW_DUPLICATE,
+            WorkerUploadService.ROW_NEW,
+        ])
+        self.assertEquals(insuree_ids, {self.worker.chf_id: self.worker.id})
+        self.assertIn("0000000000000", seen_chf_ids)
+
+    def test_claim_abandoned_upload(self):
+        upload = WorkerUpload(status=WorkerUpload.Status.IN_PROGRESS, json_ext={'heartbeat': time.time()})
+        upload.save(username=self.user.username)
+
+        self.assertIsNone(_claim_next_upload())
+
+        upload.json_ext = {'heartbeat': time.time() - WorkerVoucherConfig.worker_upload_stale_timeout - 1}
+        upload.save(username=self.user.username)
+
+        self.assertEquals(_claim_next_upload().id, upload.id)
+        self.assertIsNone(_claim_next_upload())
+
+    def test_resume_abandoned_upload(self):
+        checkpoint = {'last_committed_row': 1, 'skipped_items': 0}
+        upload = WorkerUpload(status=WorkerUpload.Status.IN_PROGRESS, json_ext={
+            'checkpoint': checkpoint, 'heartbeat': time.time()})
+        upload.save(username=self.user.username)
+
+        with self.assertRaises(ValueError):
+            resume_worker_upload(upload, self.user.username)
+
+        upload.json_ext = {'checkpoint': checkpoint,
+                           'heartbeat': time.time() - WorkerVoucherConfig.worker_upload_stale_timeout - 1}
+        upload.save(username=self.user.username)
+        resume_worker_upload(upload, self.user.username)
+
+        upload.refresh_from_db()
+        self.assertEquals(upload.status, WorkerUpload.Status.TRIGGERED)
+        self.assertEquals(upload.json_ext['checkpoint'], checkpoint)
+
+        _file, errors, summary = self._upload(self.eu.code, [self.worker2.chf_id, self.worker.chf_id], upload=upload)
+
+        # The first row was imported before the upload was abandoned
+        self.assertEquals(summary['affected_rows'], 2)
+        self.assertTrue(PolicyHolderInsuree.objects.filter(policy_holder=self.eu, insuree=self.worker).exists())
+        self.assertFalse(PolicyHolderInsuree.objects.filter(policy_holder=self.eu, insuree=self.worker2).exists())
@@ -90,3 +90,13 @@ class WorkerQueryTestCase(TestCase):
         # EU not assigned to user, should not return workers
         worker_count = Insuree.objects.filter(worker_user_filter(self.user, self.eu3.code)).count()
         self.assertEquals(worker_count, 0)
+
+    def test_query_employer_eu_assigned_after_query(self):
+        worker_count = Insuree.objects.filter(worker_user_filter(self.user, None)).count()
+        self.assertEquals(worker_count, 3)
+
+        eu4 = create_test_eu_for_user(self.user, code="test_eu4")
+        create_test_worker_for_eu(self.user, eu4, chf_id=f"{generate_random_insuree_number()}")
+
+        worker_count = Insuree.objects.filter(worker_user_filter(self.user, None)).count()
+        self.assertEquals(worker_count, 4)
@@ -7,6 +7,7 @@ from django.apps import AppConfig
 from insuree.models import Insuree
 from policyholder.models import PolicyHolder, PolicyHolderUser, PolicyHolderInsuree
 from worker_voucher.models import GroupOfWorker, WorkerGroup
+from worker_voucher.utils import get_idnp_crc
 
 
 def create_test_eu(user, code='test_eu'):
@@ -59,18 +60,6 @@ def create_test_worker_for_eu(user, eu, chf_id="2675135421017"):
     return worker
 
 
-def get_idnp_crc(idnp_first_12_digits):
-    assert len(idnp_first_12_digits) == 12
-
-    values = [7, 3, 1]
-
-    crc = 0
-    for i, c in enumerate(idnp_first_12_digits):
-        crc += int(c) * values[i % 3]
-
-    return crc % 10
-
-
 def generate_idnp():
     idnp_first_12_digits = random.randint(200000000000, 299999999999)
     return str(idnp_first_12_digits) + str(get_idnp_crc(str(idnp_first_12_digits)))
@@ -1,8 +1,11 @@
 from django.urls import path
 
-from worker_voucher.views import WorkerUploadAPIView, download_worker_upload
+from worker_voucher.views import WorkerUploadAPIView, download_worker_upload, worker_upload_status, \
+    resume_worker_upload_view
 
 urlpatterns = [
     path('worker_upload/', WorkerUploadAPIView.as_view()),
     path('download_worker_upload_file/', download_worker_upload),
+    path('worker_upload_status/', worker_upload_status),
+    path('resume_worker_upload/', resume_worker_upload_view),
 ]
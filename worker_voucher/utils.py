@@ -0,0 +1,24 @@
+def get_idnp_crc(idnp_first_12_digits):
+    assert len(idnp_first_12_digits) == 12
+
+    values = [7, 3, 1]
+
+    crc = 0
+    for i, c in enumerate(idnp_first_12_digits):
+        crc += int(c) * values[i % 3]
+
+    return crc % 10
+
+
+def bulk_create_with_ids(model, objects, key_field, **kwargs):
+    """
+    bulk_create of model objects with an AutoField id, the ids are set on the objects afterwards.
+    Not every database backend returns the AutoField ids from a bulk insert, so they are read back
+    by key_field, which must be unique among the inserted objects.
+    """
+    model.objects.bulk_create(objects, **kwargs)
+    ids = dict(model.objects.filter(**{f"{key_field}__in": [getattr(obj, key_field) for obj in objects]})
+               .values_list(key_field, 'id'))
+    for obj in objects:
+        obj.id = ids[getattr(obj, key_field)]
+    return objects
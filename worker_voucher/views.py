@@ -1,6 +1,9 @@
 import logging
 
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse
 from rest_framework import status, views
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -10,7 +13,8 @@ from im_export.views import check_user_rights
 from worker_voucher.apps import WorkerVoucherConfig
 from worker_voucher.models import WorkerUpload
 from policyholder.models import PolicyHolder
-from worker_voucher.services import WorkerUploadService
+from worker_voucher.services import economic_unit_user_filter
+from worker_voucher.tasks import start_worker_upload_processing, resume_worker_upload
 from insuree.apps import InsureeConfig
 
 logger = logging.getLogger(__name__)
@@ -19,40 +23,98 @@ logger = logging.getLogger(__name__)
 class WorkerUploadAPIView(views.APIView):
     permission_classes = [check_user_rights(InsureeConfig.gql_mutation_create_insurees_perms, )]
 
-    @transaction.atomic
     def post(self, request):
-        upload = WorkerUpload()
         economic_unit_code = request.GET.get('economic_unit_code')
+        file = request.FILES.get('file')
+        if not file:
+            return Response({'success': False, 'error': 'File is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.GET.get('dry_run', '').lower() in ('true', '1'):
+            return self._dry_run(request, economic_unit_code, file)
         try:
-            upload.save(username=request.user.login_name)
-            file = request.FILES.get('file')
-            target_file_path = WorkerVoucherConfig.get_worker_upload_payment_file_path(economic_unit_code, file.name)
-            upload.file_name = file.name
-            file_handler = DefaultStorageFileHandler(target_file_path)
-            service = WorkerUploadService(request.user)
-            file_to_upload, errors, summary = service.upload_worker(economic_unit_code, file, upload)
-            if errors:
-                upload.status = WorkerUpload.Status.PARTIAL_SUCCESS
-                upload.error = errors
-                upload.json_ext = {'extra_info': summary}
-            else:
-                upload.status = WorkerUpload.Status.SUCCESS
-                upload.json_ext = {'extra_info': summary}
-            upload.save(username=request.user.login_name)
-            file_handler.save_with_possibility_to_overwrite_file(file_to_upload)
-            return Response({'success': True, 'error': errors, 'summary': summary}, status=201)
-        except Exception as exc:
-            logger.error("Error while uploading workers", exc_info=exc)
-            if upload:
-                upload.error = {'error': str(exc)}
-                upload.policyholder = PolicyHolder.objects.filter(code=economic_unit_code).first()
-                upload.status = WorkerUpload.Status.FAIL
-                summary = {
-                    'affected_rows': 0,
-                }
-                upload.json_ext = {'extra_info': summary}
+            with transaction.atomic():
+                upload = WorkerUpload(
+                    file_name=file.name,
+                    policyholder=PolicyHolder.objects.filter(code=economic_unit_code, is_deleted=False).first(),
+                    json_ext={'economic_unit_code': economic_unit_code},
+                )
                 upload.save(username=request.user.login_name)
-            return Response({'success': False, 'error': str(exc), 'summary': summary}, status=500)
+                target_file_path = WorkerVoucherConfig.get_worker_upload_file_path(economic_unit_code, upload.id,
+                                                                                   file.name)
+                DefaultStorageFileHandler(target_file_path).save_with_possibility_to_overwrite_file(file)
+                # The upload is processed in the background, clients poll worker_upload_status
+                transaction.on_commit(start_worker_upload_processing)
+            return Response({'success': True, 'upload_id': str(upload.id), 'status': upload.status},
+                            status=status.HTTP_202_ACCEPTED)
+        except Exception as exc:
+            logger.error("Error while queueing worker upload", exc_info=exc)
+            return Response({'success': False, 'error': str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _dry_run(self, request, economic_unit_code, file):
+        """
+        Validates the file synchronously without storing or importing anything. Answers with the summary, or
+        with the file annotated with its errors column when some rows would be skipped.
+        """
+        from worker_voucher.worker_upload import WorkerUploadService
+
+        try:
+            report, errors, summary = WorkerUploadService(request.user).validate_upload(economic_unit_code, file)
+            if not errors:
+                return Response({'success': True, 'error': None, 'summary': summary})
+            response = FileResponse(report, content_type='text/csv', as_attachment=True,
+                                    filename=f"{file.name.rsplit('.', 1)[0]}_errors.csv")
+            response['X-Skipped-Items'] = summary['skipped_items']
+            response['X-Total-Number-Of-Records'] = summary['total_number_of_records_in_file']
+            return response
+        except ValueError as exc:
+            logger.error("Error while validating worker upload", exc_info=exc)
+            return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@permission_classes([check_user_rights(InsureeConfig.gql_mutation_create_insurees_perms, )])
+def worker_upload_status(request):
+    try:
+        upload = _get_user_worker_upload(request.user, request.query_params.get('upload_id'))
+        if not upload:
+            return Response({'success': False, 'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        json_ext = upload.json_ext or {}
+        return Response({
+            'success': True,
+            'upload_id': str(upload.id),
+            'status': upload.status,
+            'file_name': upload.file_name,
+            'progress': json_ext.get('progress'),
+            'summary': json_ext.get('extra_info'),
+            'error': upload.error,
+        })
+    except (ValueError, ValidationError) as exc:
+        logger.error("Error while fetching worker upload status", exc_info=exc)
+        return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["POST"])
+@permission_classes([check_user_rights(InsureeConfig.gql_mutation_create_insurees_perms, )])
+def resume_worker_upload_view(request):
+    try:
+        with transaction.atomic():
+            upload = _get_user_worker_upload(request.user, request.query_params.get('upload_id'))
+            if not upload:
+                return Response({'success': False, 'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            resume_worker_upload(upload, request.user.login_name)
+            transaction.on_commit(start_worker_upload_processing)
+        return Response({'success': True, 'upload_id': str(upload.id), 'status': upload.status},
+                        status=status.HTTP_202_ACCEPTED)
+    except (ValueError, ValidationError) as exc:
+        logger.error("Error while resuming worker upload", exc_info=exc)
+        return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _get_user_worker_upload(user, upload_id):
+    return WorkerUpload.objects.filter(
+        Q(user_created=user) | economic_unit_user_filter(user, prefix='policyholder__'),
+        id=upload_id,
+        is_deleted=False,
+    ).first()
 
 
 @api_view(["GET"])
@@ -61,11 +123,22 @@ def download_worker_upload(request):
     try:
         filename = request.query_params.get('filename')
         economic_unit_code = request.query_params.get('economic_unit_code')
-        target_file_path = WorkerVoucherConfig.get_worker_upload_payment_file_path(economic_unit_code, filename)
+        upload_id = request.query_params.get('upload_id')
+        if upload_id:
+            # Error report of a queued upload
+            upload = _get_user_worker_upload(request.user, upload_id)
+            if not upload:
+                return Response({'success': False, 'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            economic_unit_code = (upload.json_ext or {}).get('economic_unit_code')
+            target_file_path = WorkerVoucherConfig.get_worker_upload_report_file_path(
+                economic_unit_code, upload.id, upload.file_name)
+            filename = target_file_path.rsplit('/', 1)[-1]
+        else:
+            target_file_path = WorkerVoucherConfig.get_worker_upload_payment_file_path(economic_unit_code, filename)
         file_handler = DefaultStorageFileHandler(target_file_path)
         return file_handler.get_file_response_csv(filename)
 
-    except ValueError as exc:
+    except (ValueError, ValidationError) as exc:
         logger.error("Error while fetching data", exc_info=exc)
         return Response({'success': False, 'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
     except FileNotFoundError as exc:
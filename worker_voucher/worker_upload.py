@@ -0,0 +1,458 @@
+import tempfile
+import time
+from uuid import uuid4
+
+import pandas as pd
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils.translation import gettext as _
+
+from core import datetime
+from core.models import InteractiveUser
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.utils import TimeUtils
+from insuree.apps import InsureeConfig
+from insuree.gql_mutations import update_or_create_insuree
+from insuree.models import Insuree
+from insuree.services import InsureeService, validate_insuree, validate_insuree_number
+from policyholder.models import PolicyHolder, PolicyHolderInsuree
+from simple_history.utils import bulk_create_with_history
+from worker_voucher.apps import WorkerVoucherConfig
+from worker_voucher.authorization import get_user_authorization_context
+from worker_voucher.mconnect import fetch_workers_online_data
+from worker_voucher.models import WorkerUpload, WorkerUploadRowError
+from worker_voucher.utils import bulk_create_with_ids
+
+
+class WorkerUploadService:
+    ROW_NEW = 'new'
+    ROW_EXISTING_INSUREE = 'existing_insuree'
+    ROW_ALREADY_MEMBER = 'already_member'
+    ROW_DUPLICATE = 'duplicate'
+    ROW_MISSING_NATIONAL_ID = 'missing_national_id'
+
+    def __init__(self, user: InteractiveUser, mconnect_service_class=None):
+        self.user = user
+        self.mconnect_service_class = mconnect_service_class
+
+    def upload_worker(self, economic_unit_code, file, upload):
+        """
+        Streams the file in chunks of worker_upload_commit_batch_size rows. Every chunk is imported and committed
+        together with a checkpoint on the upload, then appended with its errors column to a temporary report file.
+        The report is returned instead of the uploaded file when any row has errors. An upload with a checkpoint
+        is resumed: rows before it are only copied to the report with the errors stored for them.
+        """
+        error_column = WorkerVoucherConfig.csv_worker_upload_errors_column
+        chf_id_type_column = WorkerVoucherConfig.worker_upload_chf_id_type
+        economic_unit = self._resolve_economic_unit(economic_unit_code)
+        upload.policyholder = economic_unit
+        upload.status = upload.Status.IN_PROGRESS
+        upload.save(username=self.user.login_name)
+        if not file:
+            raise ValueError(_('File is required'))
+
+        checkpoint = (upload.json_ext or {}).get('checkpoint') or {}
+        resume_from_row = checkpoint.get('last_committed_row', 0)
+        skipped_items = checkpoint.get('skipped_items', 0)
+
+        estimated_rows = self._estimate_row_count(file)
+        started = time.monotonic()
+        total_number_of_records_in_file = 0
+        errors = {}
+        seen_chf_ids = set()
+        report_file = tempfile.TemporaryFile()
+        try:
+            for chunk in self._read_file_chunks(file):
+                if not total_number_of_records_in_file:
+                    self._validate_dataframe(chunk)
+                committed_rows = chunk.index < resume_from_row
+                seen_chf_ids.update(self._normalize_chf_ids(chunk.loc[committed_rows, chf_id_type_column]).dropna())
+                chf_ids = chunk.loc[~committed_rows, chf_id_type_column]
+                chunk_errors = self._get_committed_row_errors(upload, chunk.index[committed_rows])
+                if not chf_ids.empty:
+                    with transaction.atomic():
+                        new_errors = self._upload_workers(economic_unit, chf_ids, seen_chf_ids).dropna()
+                        self._save_row_errors(upload, new_errors)
+                        checkpoint = {
+                            'last_committed_row': int(chunk.index[-1]) + 1,
+                            'skipped_items': skipped_items + len(new_errors),
+                        }
+                        self._save_checkpoint(upload, checkpoint)
+                    # Taken over only once the chunk is committed, a failed commit keeps the previous checkpoint
+                    upload.json_ext = {**(upload.json_ext or {}), 'checkpoint': checkpoint}
+                    skipped_items = checkpoint['skipped_items']
+                    chunk_errors.update(new_errors.to_dict())
+
+                chunk[error_column] = pd.Series(
+                    [chunk_errors.get(row) for row in chunk.index], index=chunk.index, dtype=object)
+                error_mask = chunk[error_column].notna()
+                errors.update(chunk[error_mask].set_index(chf_id_type_column)[error_column].to_dict())
+                chunk.to_csv(report_file, header=not total_number_of_records_in_file, index=False)
+                total_number_of_records_in_file += len(chunk)
+
+                elapsed = time.monotonic() - started
+                rows_per_second = max(total_number_of_records_in_file - resume_from_row, 0) / elapsed \
+                    if elapsed else None
+                self._report_progress(upload, total_number_of_records_in_file,
+                                      max(estimated_rows, total_number_of_records_in_file), rows_per_second)
+            if not total_number_of_records_in_file:
+                raise ValueError(_("Import file is empty"))
+        except Exception:
+            report_file.close()
+            raise
+
+        summary = {
+            'affected_rows': total_number_of_records_in_file - skipped_items,
+            'total_number_of_records_in_file': total_number_of_records_in_file,
+            'skipped_items': skipped_items
+        }
+
+        if skipped_items:
+            report_file.seek(0)
+            return File(report_file, name=file.name), errors, summary
+        report_file.close()
+        return file, None, summary
+
+    def _read_file_chunks(self, file):
+        """
+        Yields the rows of the file as DataFrames indexed by their row number in the file (header excluded).
+        """
+        batch_size = WorkerVoucherConfig.worker_upload_commit_batch_size
+        if file.name.endswith('.csv'):
+            # National ids are kept as text, a numeric column would drop leading zeros
+            yield from pd.read_csv(file, chunksize=batch_size,
+                                   dtype={WorkerVoucherConfig.worker_upload_chf_id_type: str})
+        elif file.name.endswith(('.xls', '.xlsx')):
+            from openpyxl import load_workbook
+            workbook = load_workbook(file, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                columns = next(rows, None)
+                if columns is None:
+                    return
+                batch = []
+                first_row = 0
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        yield pd.DataFrame(batch, columns=columns, index=range(first_row, first_row + len(batch)))
+                        first_row += len(batch)
+                        batch = []
+                if batch:
+                    yield pd.DataFrame(batch, columns=columns, index=range(first_row, first_row + len(batch)))
+            finally:
+                workbook.close()
+        else:
+            raise ValueError(_('Unsupported file format. Please upload a CSV or Excel file.'))
+
+    def _estimate_row_count(self, file):
+        """
+        Number of data rows used for the upload ETA, line breaks inside quoted CSV values are counted as rows.
+        """
+        if file.name.endswith('.csv'):
+            line_breaks = sum(block.count(b'\n') for block in iter(lambda: file.read(1 << 20), b''))
+            file.seek(0)
+            return max(line_breaks - 1, 0)
+        if file.name.endswith(('.xls', '.xlsx')):
+            from openpyxl import load_workbook
+            workbook = load_workbook(file, read_only=True)
+            max_row = workbook.active.max_row
+            workbook.close()
+            file.seek(0)
+            return max((max_row or 0) - 1, 0)
+        return 0
+
+    def _validate_dataframe(self, df):
+        if df is None:
+            raise ValueError(_("Unknown error while loading import file"))
+        if df.empty:
+            raise ValueError(_("Import file is empty"))
+        if WorkerVoucherConfig.csv_worker_upload_errors_column in df.columns:
+            raise ValueError(_("Column errors in csv."))
+        if WorkerVoucherConfig.worker_upload_chf_id_type not in df.columns:
+            raise ValueError(_("No national id column in csv file"))
+
+    def _resolve_economic_unit(self, economic_unit_code):
+        if not economic_unit_code:
+            raise ValueError('worker_upload.validation.economic_unit_code_required')
+        economic_unit = PolicyHolder.objects.filter(code=economic_unit_code, is_deleted=False).first()
+        if not economic_unit:
+            raise ValueError('worker_upload.validation.economic_unit_not_found')
+        return economic_unit
+
+    def _report_progress(self, upload, rows_processed, total_rows, rows_per_second):
+        upload.json_ext = {
+            **(upload.json_ext or {}),
+            'progress': {
+                'rows_processed': rows_processed,
+                'total_rows': total_rows,
+                'rows_per_second': round(rows_per_second, 2) if rows_per_second else None,
+                'eta_seconds': round((total_rows - rows_processed) / rows_per_second, 1) if rows_per_second else None,
+            },
+            'heartbeat': time.time(),
+        }
+        # Written without a new history version, progress changes after every chunk
+        WorkerUpload.objects.filter(id=upload.id).update(json_ext=upload.json_ext)
+
+    def _get_committed_row_errors(self, upload, rows) -> dict:
+        if rows.empty:
+            return {}
+        return dict(WorkerUploadRowError.objects.filter(
+            upload_id=upload.id, row__gte=int(rows[0]), row__lte=int(rows[-1])).values_list('row', 'errors'))
+
+    def _save_row_errors(self, upload, errors: pd.Series):
+        # Only the errors of the chunk are written, the checkpoint itself stays the same size however many rows fail
+        WorkerUploadRowError.objects.bulk_create([
+            WorkerUploadRowError(upload_id=upload.id, row=int(row), errors=row_errors)
+            for row, row_errors in errors.items()
+        ], batch_size=WorkerVoucherConfig.worker_upload_batch_size)
+
+    def _save_checkpoint(self, upload, checkpoint):
+        # Saved in the transaction of the chunk, the checkpoint always matches the committed rows
+        WorkerUpload.objects.filter(id=upload.id).update(
+            json_ext={**(upload.json_ext or {}), 'checkpoint': checkpoint, 'heartbeat': time.time()})
+
+    def _upload_workers(self, economic_unit, chf_ids: pd.Series, seen_chf_ids: set) -> pd.Series:
+        """
+        Adds the workers of the file to the economic unit with a fixed number of queries per batch of national ids
+        and returns the errors of every row, NaN for the rows that were imported.
+        """
+        chf_ids = self._normalize_chf_ids(chf_ids)
+        if not self._can_use_economic_unit(economic_unit):
+            return self._unauthorized_errors(chf_ids)
+
+        row_classes, insuree_ids = self._classify_rows(economic_unit, chf_ids, seen_chf_ids)
+        errors_by_chf_id = {}
+        new_chf_ids = list(chf_ids[row_classes == self.ROW_NEW])
+        insuree_ids.update(self._create_workers(new_chf_ids, economic_unit, errors_by_chf_id))
+        self._add_workers_to_economic_unit(economic_unit, insuree_ids.values())
+        return self._row_errors(chf_ids, row_classes, errors_by_chf_id)
+
+    def _classify_rows(self, economic_unit, chf_ids: pd.Series, seen_chf_ids: set):
+        """
+        De-duplication stage, run before anything is written. Every row is classified as new worker, existing
+        insuree, already a member of the economic unit, repeated national id (seen earlier in the file, including
+        previous chunks through seen_chf_ids) or missing national id. Returns the classes and the ids of the
+        existing insurees by national id.
+        """
+        row_classes = pd.Series(self.ROW_NEW, index=chf_ids.index, dtype=object)
+        row_classes[chf_ids.isna()] = self.ROW_MISSING_NATIONAL_ID
+        row_classes[chf_ids.notna() & (chf_ids.duplicated() | chf_ids.isin(list(seen_chf_ids)))] = self.ROW_DUPLICATE
+
+        unique_chf_ids = list(chf_ids[row_classes == self.ROW_NEW])
+        seen_chf_ids.update(unique_chf_ids)
+        members = self._get_economic_unit_member_chf_ids(economic_unit, unique_chf_ids)
+        insuree_ids = self._get_insuree_ids_by_chf_id([chf_id for chf_id in unique_chf_ids if chf_id not in members])
+
+        row_classes[(row_classes == self.ROW_NEW) & chf_ids.isin(list(members))] = self.ROW_ALREADY_MEMBER
+        row_classes[(row_classes == self.ROW_NEW) & chf_ids.isin(list(insuree_ids))] = self.ROW_EXISTING_INSUREE
+        return row_classes, insuree_ids
+
+    def validate_upload(self, economic_unit_code, file):
+        """
+        Dry run of upload_worker, nothing is written. Reports the rows that upload_worker would skip: unauthorized
+        economic unit, invalid national ids, workers already in the economic unit and repeated national ids.
+        Workers that are not registered yet are only checked as far as possible without MConnect.
+        Returns the same (file, errors, summary) as upload_worker.
+        """
+        error_column = WorkerVoucherConfig.csv_worker_upload_errors_column
+        chf_id_type_column = WorkerVoucherConfig.worker_upload_chf_id_type
+        economic_unit = self._resolve_economic_unit(economic_unit_code)
+        if not file:
+            raise ValueError(_('File is required'))
+
+        total_number_of_records_in_file = 0
+        skipped_items = 0
+        errors = {}
+        seen_chf_ids = set()
+        report_file = tempfile.TemporaryFile()
+        try:
+            for chunk in self._read_file_chunks(file):
+                if not total_number_of_records_in_file:
+                    self._validate_dataframe(chunk)
+                chunk[error_column] = self._validate_workers(economic_unit, chunk[chf_id_type_column], seen_chf_ids)
+                error_mask = chunk[error_column].notna()
+                skipped_items += int(error_mask.sum())
+                errors.update(chunk[error_mask].set_index(chf_id_type_column)[error_column].to_dict())
+                chunk.to_csv(report_file, header=not total_number_of_records_in_file, index=False)
+                total_number_of_records_in_file += len(chunk)
+            if not total_number_of_records_in_file:
+                raise ValueError(_("Import file is empty"))
+        except Exception:
+            report_file.close()
+            raise
+
+        summary = {
+            'affected_rows': total_number_of_records_in_file - skipped_items,
+            'total_number_of_records_in_file': total_number_of_records_in_file,
+            'skipped_items': skipped_items
+        }
+
+        if skipped_items:
+            report_file.seek(0)
+            return File(report_file, name=file.name), errors, summary
+        report_file.close()
+        return file, None, summary
+
+    def _validate_workers(self, economic_unit, chf_ids: pd.Series, seen_chf_ids: set) -> pd.Series:
+        chf_ids = self._normalize_chf_ids(chf_ids)
+        if not self._can_use_economic_unit(economic_unit):
+            return self._unauthorized_errors(chf_ids)
+
+        row_classes, _insuree_ids = self._classify_rows(economic_unit, chf_ids, seen_chf_ids)
+        errors_by_chf_id = {}
+        for chf_id in chf_ids[row_classes == self.ROW_NEW]:
+            new_worker_errors = self._validate_new_worker(chf_id)
+            if new_worker_errors:
+                errors_by_chf_id[chf_id] = new_worker_errors
+        return self._row_errors(chf_ids, row_classes, errors_by_chf_id)
+
+    def _validate_new_worker(self, chf_id):
+        if WorkerVoucherConfig.validate_created_worker_online:
+            # Names, date of birth and photo would come from MConnect, only the national id can be checked here
+            return validate_insuree_number(chf_id)
+        try:
+            self._build_worker({'chf_id': chf_id, 'audit_user_id': self.user.id_for_audit})
+        except Exception as e:
+            return [{"success": False, "error": str(e)}]
+        return None
+
+    def _normalize_chf_ids(self, chf_ids: pd.Series) -> pd.Series:
+        return chf_ids.map(lambda chf_id: None if pd.isna(chf_id) else str(chf_id))
+
+    def _unauthorized_errors(self, chf_ids: pd.Series) -> pd.Series:
+        return pd.Series(
+            [[{"message": _("worker_upload.validation.no_authority_to_use_selected_economic_unit")}]
+             for _row in range(len(chf_ids))],
+            index=chf_ids.index, dtype=object)
+
+    def _row_errors(self, chf_ids: pd.Series, row_classes: pd.Series, errors_by_chf_id: dict) -> pd.Series:
+        errors = chf_ids.where(row_classes == self.ROW_NEW).map(errors_by_chf_id).astype(object)
+        row_class_messages = {
+            self.ROW_ALREADY_MEMBER: _("workers.validation.worker_already_assigned_to_unit"),
+            self.ROW_DUPLICATE: _("worker_upload.validation.national_id_repeated_in_file"),
+            self.ROW_MISSING_NATIONAL_ID: _("worker_upload.validation.national_id_required"),
+        }
+        for index, row_class in row_classes[row_classes.isin(list(row_class_messages))].items():
+            errors.at[index] = [{"message": row_class_messages[row_class]}]
+        return errors
+
+    def _can_use_economic_unit(self, economic_unit):
+        authorization = get_user_authorization_context(self.user)
+        return authorization.can_access_all_economic_units(WorkerVoucherConfig.gql_worker_voucher_search_all_perms) \
+            or economic_unit.id in authorization.policyholder_ids
+
+    def _get_economic_unit_member_chf_ids(self, economic_unit, chf_ids):
+        members = set()
+        for batch in _split_in_batches(chf_ids, WorkerVoucherConfig.worker_upload_batch_size):
+            members.update(PolicyHolderInsuree.objects.filter(
+                insuree__chf_id__in=batch,
+                insuree__validity_to__isnull=True,
+                policy_holder=economic_unit,
+                is_deleted=False,
+            ).values_list('insuree__chf_id', flat=True))
+        return members
+
+    def _get_insuree_ids_by_chf_id(self, chf_ids):
+        insuree_ids = {}
+        for batch in _split_in_batches(chf_ids, WorkerVoucherConfig.worker_upload_batch_size):
+            insuree_ids.update(Insuree.objects.filter(
+                chf_id__in=batch,
+                validity_to__isnull=True,
+            ).values_list('chf_id', 'id'))
+        return insuree_ids
+
+    def _create_workers(self, chf_ids, economic_unit, errors_by_chf_id):
+        """
+        Workers with a photo from MConnect go through the insuree service, which stores the photo,
+        the others are validated the same way and inserted in batches.
+        """
+        now = TimeUtils.now()
+        created_insuree_ids = {}
+        insurees = []
+        online_results = {}
+        if WorkerVoucherConfig.validate_created_worker_online:
+            online_results = fetch_workers_online_data(chf_ids, self.user, economic_unit,
+                                                       service_class=self.mconnect_service_class)
+        for chf_id in chf_ids:
+            worker_data = self._parse_mconnect_result(chf_id, online_results.get(chf_id))
+            # Only a failed lookup returns the MConnect result itself, fetched worker data has no success flag
+            if "success" in worker_data:
+                errors_by_chf_id[chf_id] = [worker_data]
+                continue
+            worker_data['chf_id'] = chf_id
+            worker_data['audit_user_id'] = self.user.id_for_audit
+            worker_data['validity_from'] = now
+            try:
+                if worker_data.get('photo'):
+                    created_insuree_ids[chf_id] = update_or_create_insuree(worker_data, self.user).id
+                else:
+                    insurees.append((worker_data, self._build_worker(worker_data)))
+            except Exception as e:
+                errors_by_chf_id[chf_id] = [{"success": False, "error": str(e)}]
+
+        for batch in _split_in_batches(insurees, WorkerVoucherConfig.worker_upload_batch_size):
+            self._bulk_create_workers(batch)
+            created_insuree_ids.update((insuree.chf_id, insuree.id) for _worker_data, insuree in batch)
+        return created_insuree_ids
+
+    def _bulk_create_workers(self, workers):
+        """
+        Inserts the (worker data, insuree) pairs in one statement. The receivers of insuree_service.create_or_update
+        are called for every worker with the same arguments and result as InsureeService.create_or_update.
+        """
+        insuree_service = InsureeService(self.user)
+        signal = REGISTERED_SERVICE_SIGNALS['insuree_service.create_or_update']
+        for worker_data, _insuree in workers:
+            signal.send_signal_before(sender=insuree_service, cls_=insuree_service, data=[(worker_data,), {}],
+                                      context=None)
+        bulk_create_with_ids(Insuree, [insuree for _worker_data, insuree in workers], 'uuid')
+        for worker_data, insuree in workers:
+            signal.send_signal_after(sender=insuree_service, cls_=insuree_service, data=[(worker_data,), {}],
+                                     context=None, result=insuree)
+
+    def _build_worker(self, worker_data):
+        if InsureeConfig.is_insuree_photo_required:
+            raise ValidationError(_("mutation.insuree.no_required_photo"))
+        if InsureeConfig.insuree_fsp_mandatory and 'health_facility_id' not in worker_data:
+            raise ValidationError("mutation.insuree.fsp_required")
+        insuree = Insuree(uuid=str(uuid4()), **worker_data)
+        validate_insuree(insuree)
+        return insuree
+
+    def _parse_mconnect_result(self, chf_id, online_result):
+        data_from_mconnect = {}
+        if online_result is not None:
+            if not online_result.get("success", False):
+                return {**online_result, "success": False}
+            else:
+                data_from_mconnect['chf_id'] = chf_id
+                data_from_mconnect['other_names'] = online_result["data"]["GivenName"]
+                data_from_mconnect['last_name'] = online_result["data"]["FamilyName"]
+                data_from_mconnect['dob'] = online_result["data"]["DateOfBirth"]
+                data_from_mconnect['photo'] = {"photo": online_result["data"]["Photo"]}
+        return data_from_mconnect
+
+    def _add_workers_to_economic_unit(self, economic_unit, insuree_ids):
+        now = datetime.datetime.now()
+        policy_holder_insurees = [PolicyHolderInsuree(
+            id=uuid4(),
+            policy_holder=economic_unit,
+            insuree_id=insuree_id,
+            contribution_plan_bundle=None,
+            user_created=self.user,
+            user_updated=self.user,
+            date_created=now,
+            date_updated=now,
+        ) for insuree_id in insuree_ids]
+        if policy_holder_insurees:
+            bulk_create_with_history(policy_holder_insurees, PolicyHolderInsuree,
+                                     batch_size=WorkerVoucherConfig.worker_upload_batch_size,
+                                     default_user=self.user)
+
+
+def _split_in_batches(items, batch_size):
+    items = list(items)
+    for offset in range(0, len(items), batch_size):
+        yield items[offset:offset + batch_size]